@@ -0,0 +1,100 @@
+"""
+environment for benchmarks, a seeded sqlite database.
+
+benchmarks are not run by nosetests, run them directly, e.g.
+
+    python tests/bench_job.py
+"""
+import os
+import time
+import random
+import datetime
+import tempfile
+
+import sqlalchemy
+
+
+def setup(name):
+    """
+    setup wumai with a new sqlite database, return the db.
+    """
+    from wumai import config
+    from wumai import logger
+    from wumai import db
+    from wumai.common import db as common_db
+
+    directory = tempfile.mkdtemp(prefix='wumai-bench-')
+
+    config.setup()
+    config.CONF.apply(app_root=os.path.dirname(os.path.abspath(__file__)),
+                      log_dir=directory)
+    logger.init(dirname=name)
+
+    strategy = 'sqlite:///%s' % os.path.join(directory, '%s.db' % name)
+    engine = sqlalchemy.create_engine(strategy)
+
+    from wumai.model.job import schema
+    schema.create_tables(engine)
+    engine.dispose()
+
+    db.DB = common_db.Database(strategy)
+    return db.DB
+
+
+def drop_indexes(table):
+    for index in sqlalchemy.inspect(table.engine).get_indexes(table.name):
+        table.engine.execute('DROP INDEX %s' % index['name'])
+
+
+def seed_jobs(table, total, pending_ratio=0.01, batch_size=10000):
+    """
+    insert total jobs, most of them are finished like a long running table.
+    """
+    now = datetime.datetime.utcnow()
+    start = now - datetime.timedelta(days=365)
+
+    rows = []
+    for i in xrange(total):
+        created = start + datetime.timedelta(seconds=i * 30)
+        if random.random() < pending_ratio:
+            status = 'pending'
+            run_at = now - datetime.timedelta(seconds=random.randint(-600, 600))  # noqa
+        else:
+            status = 'finished'
+            run_at = created
+
+        rows.append({
+            'id': 'job-%010d' % i,
+            'project_id': 'project-%d' % (i % 100),
+            'action': 'Sync',
+            'status': status,
+            'error': '',
+            'result': '{}',
+            'params': '{}',
+            'updated': created,
+            'created': created,
+            'run_at': run_at,
+            'try_period': 600,
+            'try_max': 3,
+            'trys': 0,
+            'priority': 0,
+        })
+
+        if len(rows) >= batch_size:
+            table.engine.execute(table.t.insert(), rows)
+            rows = []
+
+    if rows:
+        table.engine.execute(table.t.insert(), rows)
+
+
+def timeit(func, times=20):
+    """
+    return average milliseconds of calling func.
+    """
+    func()
+
+    start = time.time()
+    for i in xrange(times):
+        func()
+    return (time.time() - start) * 1000 / times
@@ -0,0 +1,56 @@
+"""
+compare how workers select due jobs:
+
+    limitation: COUNT(*) the whole table, then SELECT newest first.
+    due:        SELECT by (status, priority, run_at, id), no COUNT,
+                keyset paging.
+
+with and without the recommended index in wumai.model.job.schema.
+
+usage: python tests/bench_job.py [total_rows]
+"""
+import sys
+import datetime
+
+import bench_env
+
+
+def main(total):
+    database = bench_env.setup('bench_job')
+
+    from wumai.model.job import job as job_model
+    from wumai.model.job import schema
+
+    bench_env.drop_indexes(database.job)
+    bench_env.seed_jobs(database.job, total)
+
+    def limitation():
+        job_model.limitation(status=job_model.JOB_STATUS_PENDING,
+                             limit=10,
+                             run_at=datetime.datetime.utcnow())
+
+    def due():
+        job_model.due(limit=10)
+
+    def due_next_page():
+        jobs = job_model.due(limit=10)
+        last = jobs[-1]
+        job_model.due(limit=10,
+                      after=(last['priority'], last['run_at'], last['id']))
+
+    print 'rows: %d, due jobs: %d' % (total, job_model.count_due())
+    print '%-20s %12s %12s' % ('query', 'no index', 'index')
+
+    results = []
+    for func in [limitation, due, due_next_page]:
+        results.append([func.__name__, bench_env.timeit(func)])
+
+    schema.create_indexes(database.engine)
+
+    for result, func in zip(results, [limitation, due, due_next_page]):
+        result.append(bench_env.timeit(func))
+        print '%-20s %10.2fms %10.2fms' % tuple(result)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
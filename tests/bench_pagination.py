@@ -0,0 +1,94 @@
+"""
+compare memory and latency of reading page 1 and a deep page of jobs:
+
+    slicing: the old way, SELECT all rows then slice them in python.
+    offset:  OFFSET/LIMIT compiled into the selection.
+    keyset:  keyset_pagination, starting after the cursor of previous page.
+
+every case runs in a forked process, so peak RSS growth is its own.
+
+usage: python tests/bench_pagination.py [total_rows] [page]
+"""
+import os
+import sys
+import time
+import json
+import resource
+
+import bench_env
+
+PAGE_SIZE = 10
+
+
+def measure(func):
+    """
+    run func in a child process, return (milliseconds, peak rss growth KB)
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        func()
+        duration = (time.time() - start) * 1000
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        os.write(w, json.dumps([duration, growth]))
+        os._exit(0)
+
+    os.close(w)
+    result = json.loads(os.read(r, 1024))
+    os.waitpid(pid, 0)
+    return result
+
+
+def main(total, page):
+    database = bench_env.setup('bench_pagination')
+    table = database.job
+
+    bench_env.seed_jobs(table, total)
+    table.engine.execute('CREATE INDEX job_created_id ON job (created, id)')
+    table.engine.dispose()
+
+    from wumai.common import db as common_db
+    import sqlalchemy
+
+    order_by = [table.c.created.desc(), table.c.id.desc()]
+
+    def slicing(start):
+        selection = sqlalchemy.select([table.t]).order_by(*order_by)
+        common_db.Database._execute(table.engine, selection,
+                                    start=start, length=PAGE_SIZE)
+
+    def offset(start):
+        table.select(start=start, length=PAGE_SIZE, order_by=order_by)
+
+    def keyset(start):
+        # cursor of the page before, as if client walked here page by page.
+        after = None
+        if start > 0:
+            last = table.select(start=start - 1, length=1,
+                                order_by=order_by)[0]
+            after = common_db.encode_cursor([last['created'], last['id']])
+
+        return lambda: table.keyset_pagination(after=after, limit=PAGE_SIZE)
+
+    print 'rows: %d, page size: %d' % (total, PAGE_SIZE)
+    print '%-10s %6s %12s %14s' % ('query', 'page', 'latency', 'peak rss +')
+    for func in [slicing, offset, keyset]:
+        for p in [1, page]:
+            start = (p - 1) * PAGE_SIZE
+            if func is keyset:
+                run = keyset(start)
+            else:
+                run = lambda: func(start)
+
+            duration, growth = measure(run)
+            print '%-10s %6d %10.2fms %12dKB' % (func.__name__, p,
+                                                 duration, growth)
+
+
+if __name__ == '__main__':
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    page = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    main(total, page)
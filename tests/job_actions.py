@@ -0,0 +1,33 @@
+"""
+job actions of tests, see job.registry.
+"""
+from wumai import error
+from wumai.model.job import job
+from wumai.model.job.registry import action
+
+
+def foo(params, time_sleep=None, is_last_chance=None):
+    return {'n': params.get('n')}
+
+
+def boom(params, time_sleep=None, is_last_chance=None):
+    raise ValueError('boom')
+
+
+def invalid(params, time_sleep=None, is_last_chance=None):
+    raise error.InvalidRequestParameter('invalid')
+
+
+def nap(params, time_sleep=None, is_last_chance=None):
+    time_sleep(params.get('seconds', 1))
+    return {}
+
+
+@action(soft_timeout=True)
+def soft_nap(params, time_sleep=None, is_last_chance=None):
+    time_sleep(params.get('seconds', 1))
+    return {}
+
+
+def deadline(params, time_sleep=None, is_last_chance=None):
+    return {'soft_deadline': str(job.soft_deadline())}
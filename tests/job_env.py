@@ -0,0 +1,73 @@
+"""
+environment for job tests, a new sqlite database with the recommended
+job schema for every test, no mysql needed.
+"""
+import os
+import datetime
+import tempfile
+
+import sqlalchemy
+
+DIRECTORY = tempfile.mkdtemp(prefix='wumai-test-')
+
+
+def _init():
+    from wumai import config
+    from wumai import logger
+
+    config.setup()
+    config.CONF.apply(app_root=os.path.dirname(os.path.abspath(__file__)),
+                      log_dir=DIRECTORY)
+    logger.init(dirname='tests')
+
+
+def setup():
+    """
+    a new sqlite database for wumai, return the db.
+    """
+    from wumai import db
+    from wumai.common import db as common_db
+
+    path = os.path.join(DIRECTORY, 'job.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+    strategy = 'sqlite:///%s' % path
+    engine = sqlalchemy.create_engine(strategy)
+
+    from wumai.model.job import schema
+    schema.create_tables(engine)
+    engine.dispose()
+
+    if db.DB is not None:
+        db.DB.close()
+    db.DB = common_db.Database(strategy)
+    return db.DB
+
+
+def ago(seconds):
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+
+
+class FakeWorker(object):
+    """
+    what job.execute needs of a worker, actions of tests.job_actions.
+    """
+    def __init__(self, worker_id='w1', exec_timeout=600, exec_grace=30,
+                 lease=60, executor=None):
+        from wumai.model.job.registry import Registry
+        from wumai.server.executor import GeventExecutor
+
+        self.worker_id = worker_id
+        self.exec_timeout = exec_timeout
+        self.exec_grace = exec_grace
+        self.lease = lease
+        self.actions = Registry('tests.job_actions')
+        self.executor = executor or GeventExecutor(1)
+        self.notified = []
+
+    def notify(self, topic, job, *args, **kwargs):
+        self.notified.append((topic, job['id']))
+
+
+_init()
@@ -0,0 +1,32 @@
+"""
+action module of registry tests.
+"""
+import functools
+
+from wumai.common.utils import snake_case  # noqa
+from wumai.model.job.registry import action
+
+
+def foo(params, **kwargs):
+    return 'foo'
+
+
+@action(timeout=60, retry_policy='exponential', soft_timeout=True)
+def slow(params, **kwargs):
+    return 'slow'
+
+
+def _echo(params, word=None, **kwargs):
+    return word
+
+
+class Callable(object):
+    def __call__(self, params, **kwargs):
+        return 'callable'
+
+
+partial = functools.partial(_echo, word='partial')
+
+instance = Callable()
+
+not_callable = 1
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+
+from nose import tools
+
+import job_env
+from wumai import blob
+from wumai import error
+from wumai.common.blob import FileStore, TableStore
+from wumai.model.job import job as job_model
+
+
+class StoreTests(object):
+
+    def test_put_get(self):
+        key = self.store.put('data' * 100)
+        tools.assert_equal(key, self.store.put('data' * 100))
+        tools.assert_equal('data' * 100, self.store.get(key))
+        tools.assert_not_equal(key, self.store.put('other'))
+
+    def test_get_missing(self):
+        with tools.assert_raises(KeyError):
+            self.store.get('0' * 40)
+
+
+class TestFileStore(StoreTests):
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp(dir=job_env.DIRECTORY)
+        self.store = FileStore(self.directory)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_one_file_a_blob(self):
+        key = self.store.put('data')
+        self.store.put('data')
+        tools.assert_equal([key],
+                           os.listdir(os.path.join(self.directory, key[:2])))
+
+
+class TestTableStore(StoreTests):
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.store = TableStore(self.db.job_blob)
+
+
+class TestPack:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.directory = tempfile.mkdtemp(dir=job_env.DIRECTORY)
+        blob.STORE = FileStore(self.directory)
+        blob.THRESHOLD = 100
+
+    def teardown(self):
+        blob.STORE = None
+        blob.THRESHOLD = 4096
+        shutil.rmtree(self.directory)
+
+    def test_threshold(self):
+        tools.assert_equal('x' * 99, blob.pack('x' * 99))
+        tools.assert_equal(None, blob.pack(None))
+
+        packed = blob.pack('x' * 100)
+        tools.assert_true(packed.startswith(blob.PREFIX))
+        tools.assert_equal('x' * 100, blob.unpack(packed))
+        tools.assert_equal('x' * 99, blob.unpack('x' * 99))
+
+    def test_unicode(self):
+        text = u'\xe9' * 100
+        tools.assert_equal(text.encode('utf-8'),
+                           blob.unpack(blob.pack(text)))
+
+    def test_no_store_configured(self):
+        packed = blob.pack('x' * 100)
+        blob.STORE = None
+        with tools.assert_raises(error.ServerInternalError) as cm:
+            blob.unpack(packed)
+        tools.assert_in('BLOB_DIR', cm.exception.message)
+
+    def test_job_params_round_trip(self):
+        params = {'resource_ids': ['r-%d' % i for i in range(50)]}
+        a = job_model.create('Foo', params=params)
+
+        tools.assert_true(
+            self.db.job.get(a)['params'].startswith(blob.PREFIX))
+        job = job_model.get(a)
+        tools.assert_equal(params, job.get_params())
+        tools.assert_equal(params['resource_ids'], job.get_resources())
+
+        blob.STORE = None
+        with tools.assert_raises(error.ServerInternalError):
+            job.get_resources()
@@ -0,0 +1,75 @@
+import datetime
+
+from nose import tools
+
+from wumai.common.cron import Cron
+
+
+def t(*args):
+    return datetime.datetime(*args)
+
+
+class TestCron:
+
+    def test_next(self):
+        cases = [
+            ('*/15 * * * *', t(2024, 1, 1, 0, 0), t(2024, 1, 1, 0, 15)),
+            ('*/15 * * * *', t(2024, 1, 1, 0, 14, 59), t(2024, 1, 1, 0, 15)),
+            ('0,30 9-10 * * *', t(2024, 1, 1, 10, 30), t(2024, 1, 2, 9, 0)),
+            ('5 1-10/3 * * *', t(2024, 1, 1, 4, 5), t(2024, 1, 1, 7, 5)),
+            ('0 0 * * *', t(2024, 12, 31, 23, 59), t(2025, 1, 1, 0, 0)),
+            ('0 12 * 6 *', t(2024, 7, 1), t(2025, 6, 1, 12, 0)),
+        ]
+        for expression, after, expected in cases:
+            tools.assert_equal(expected, Cron(expression).next(after))
+
+    def test_day_of_month_or_day_of_week(self):
+        # 2024-01-01 is a monday.
+        cron = Cron('0 0 13 * 5')
+        tools.assert_equal(t(2024, 1, 5), cron.next(t(2024, 1, 1)))
+        tools.assert_equal(t(2024, 1, 12), cron.next(t(2024, 1, 5)))
+        tools.assert_equal(t(2024, 1, 13), cron.next(t(2024, 1, 12)))
+
+        # either restricted field alone must match.
+        tools.assert_equal(t(2024, 2, 13), Cron('0 0 13 * *').next(
+            t(2024, 1, 13)))
+        tools.assert_equal(t(2024, 1, 5), Cron('0 0 * * 5').next(
+            t(2024, 1, 1)))
+
+    def test_sunday_is_0_and_7(self):
+        # 2024-01-07 is a sunday.
+        for expression in ['0 0 * * 0', '0 0 * * 7']:
+            tools.assert_equal(t(2024, 1, 7),
+                               Cron(expression).next(t(2024, 1, 1)))
+
+    def test_macros(self):
+        after = t(2024, 3, 15, 10, 30)
+        cases = [
+            ('@yearly', t(2025, 1, 1)),
+            ('@annually', t(2025, 1, 1)),
+            ('@monthly', t(2024, 4, 1)),
+            ('@weekly', t(2024, 3, 17)),
+            ('@daily', t(2024, 3, 16)),
+            ('@midnight', t(2024, 3, 16)),
+            ('@hourly', t(2024, 3, 15, 11, 0)),
+        ]
+        for expression, expected in cases:
+            tools.assert_equal(expected, Cron(expression).next(after))
+
+    def test_skip_to_rare_days(self):
+        tools.assert_equal(t(2028, 2, 29),
+                           Cron('0 0 29 2 *').next(t(2024, 3, 1)))
+        tools.assert_equal(t(2024, 3, 31),
+                           Cron('0 0 31 * *').next(t(2024, 2, 1)))
+
+    def test_never_matches(self):
+        with tools.assert_raises(ValueError):
+            Cron('0 0 31 2 *').next(t(2024, 1, 1))
+
+    def test_invalid(self):
+        for expression in ['', '* * * *', '60 * * * *', '* 24 * * *',
+                           '* * 0 * *', '* * * 13 *', '* * * * 8',
+                           '*/0 * * * *', '5-1 * * * *', 'a * * * *',
+                           '@often']:
+            with tools.assert_raises(ValueError):
+                Cron(expression)
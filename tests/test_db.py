@@ -0,0 +1,231 @@
+import os
+import shutil
+import tempfile
+
+import mock
+import sqlalchemy
+from nose import tools
+
+import job_env
+from wumai import error
+from wumai.common import db as common_db
+from wumai.model.job import job as job_model
+
+
+class TestCursor:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def test_cursor_round_trip(self):
+        values = [0, job_env.ago(0), u'job-1']
+        cursor = common_db.encode_cursor(values)
+        tools.assert_equal(values, common_db.decode_cursor(cursor))
+
+    def test_invalid_cursor(self):
+        for cursor in ['', 'not base64!', u'\xe9', 'e30=']:
+            with tools.assert_raises(ValueError) as cm:
+                common_db.decode_cursor(cursor)
+            str(cm.exception)
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        with tools.assert_raises(error.InvalidRequestParameter):
+            job_model.keyset_pagination(after=u'\xe9')
+
+
+class TestTable:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.table = self.db.job_schedule
+        self.table.insert(name='a', last_run_at=job_env.ago(0))
+
+    def test_unknown_columns_raise(self):
+        now = job_env.ago(0)
+        with tools.assert_raises(sqlalchemy.exc.CompileError):
+            self.table.update('a', updated=now, last_runat=now)
+        with tools.assert_raises(sqlalchemy.exc.CompileError):
+            self.table.update('a', last_runat=now)
+        with tools.assert_raises(sqlalchemy.exc.CompileError):
+            self.table.insert(name='b', last_run_at=now, lastrun=now)
+        with tools.assert_raises(sqlalchemy.exc.CompileError):
+            self.table.bulk_insert([{'name': 'c', 'last_runat': now}])
+
+        tools.assert_equal(None, self.table.get('a')['updated'])
+        tools.assert_equal(['a'], [r['name'] for r in self.table.select()])
+
+    def test_empty_update_raises(self):
+        with tools.assert_raises(sqlalchemy.exc.CompileError):
+            self.table.update('a')
+
+    def test_update(self):
+        now = job_env.ago(0)
+        tools.assert_equal(1, self.table.update('a', updated=now))
+        tools.assert_equal(0, self.table.update('b', updated=now))
+        tools.assert_equal(now, self.table.get('a')['updated'])
+
+    def test_update_with_expressions(self):
+        a = job_model.create('Foo')
+        c = self.db.job.c
+        tools.assert_equal(1, self.db.job.update(a, trys=c.trys + 1))
+        tools.assert_equal(1, self.db.job.get(a)['trys'])
+
+        now = job_env.ago(0)
+        updated = sqlalchemy.func.coalesce(self.table.c.updated, now)
+        tools.assert_equal(1, self.table.update('a', updated=updated))
+        tools.assert_equal(now, self.table.get('a')['updated'])
+
+    def test_insert_with_expressions(self):
+        now = job_env.ago(0)
+        self.table.insert(name=sqlalchemy.literal('b'), last_run_at=now)
+        tools.assert_equal(now, self.table.get('b')['last_run_at'])
+
+
+class TestDatabase:
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp(dir=job_env.DIRECTORY)
+        self.strategy = 'sqlite:///%s' % os.path.join(self.directory, 'a.db')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self._sql('create table a (id varchar(32) primary key, n integer)')
+        self._sql('create table b (id varchar(32) primary key)')
+        self.databases = []
+
+    def teardown(self):
+        for database in self.databases:
+            database.close()
+        shutil.rmtree(self.directory)
+
+    def _sql(self, sql, strategy=None):
+        engine = sqlalchemy.create_engine(strategy or self.strategy)
+        engine.execute(sql)
+        engine.dispose()
+
+    def _database(self, strategy=None, **kwargs):
+        database = common_db.Database(strategy or self.strategy, **kwargs)
+        self.databases.append(database)
+        return database
+
+    def _caches(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_lazy(self):
+        database = self._database(lazy=True)
+        tools.assert_equal(['a', 'b'], sorted(database.tables()))
+        tools.assert_not_in('a', database.__dict__)
+        tools.assert_equal({}, dict(database.meta.tables))
+
+        database.a.insert(id='x', n=1)
+        tools.assert_in('a', database.__dict__)
+        tools.assert_equal(['a'], list(database.meta.tables))
+        tools.assert_equal(1, database['a'].get('x')['n'])
+
+        with tools.assert_raises(AttributeError):
+            database.c
+
+    def test_lazy_drop_and_rename(self):
+        database = self._database(lazy=True)
+        database.a.insert(id='x', n=1)
+
+        database.drop_table('b')
+        tools.assert_equal(['a'], database.tables())
+        with tools.assert_raises(AttributeError):
+            database.b
+
+        c = database.rename_table('a', 'c')
+        tools.assert_equal(['c'], database.tables())
+        tools.assert_equal(1, c.get('x')['n'])
+        tools.assert_is(c, database.c)
+        with tools.assert_raises(AttributeError):
+            database.a
+        tools.assert_equal(['c'], list(database.meta.tables))
+
+    def test_drop_and_rename(self):
+        database = self._database()
+        database.drop_table('b')
+        tools.assert_equal(['a'], database.tables())
+        database.rename_table('a', 'c')
+        tools.assert_equal(['c'], database.tables())
+        with tools.assert_raises(AttributeError):
+            database.a
+
+    def test_cache_hit_and_miss(self):
+        self._database(cache_dir=self.cache_dir)
+        caches = self._caches()
+        tools.assert_equal(1, len(caches))
+
+        with mock.patch.object(sqlalchemy.MetaData, 'reflect') as reflect:
+            database = self._database(cache_dir=self.cache_dir)
+        tools.assert_false(reflect.called)
+        database.a.insert(id='x', n=1)
+        tools.assert_equal(caches, self._caches())
+
+        # a changed schema misses, the cache of the old one is removed.
+        self._sql('alter table a add column m integer')
+        database = self._database(cache_dir=self.cache_dir)
+        tools.assert_in('m', database.a.fields)
+        tools.assert_equal(1, len(self._caches()))
+        tools.assert_not_equal(caches, self._caches())
+
+    def test_databases_share_cache_dir(self):
+        other = 'sqlite:///%s' % os.path.join(self.directory, 'other.db')
+        self._sql('create table z (id varchar(32) primary key)', other)
+
+        self._database(cache_dir=self.cache_dir)
+        mine = self._caches()
+        self._database(other, cache_dir=self.cache_dir)
+        tools.assert_equal(2, len(self._caches()))
+
+        # a schema change prunes caches of its own database only.
+        self._sql('alter table z add column m integer', other)
+        self._database(other, cache_dir=self.cache_dir)
+        caches = self._caches()
+        tools.assert_equal(2, len(caches))
+        tools.assert_true(set(mine) < set(caches))
+
+
+class TestBulk:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.table = self.db.job_schedule
+
+    def _rows(self):
+        return dict((row['name'], row['last_run_at'])
+                    for row in self.table.select())
+
+    def test_bulk_insert(self):
+        now = job_env.ago(0)
+        items = [{'name': 'n-%02d' % i, 'last_run_at': now}
+                 for i in range(7)]
+        tools.assert_equal(7, self.table.bulk_insert(items, batch_size=3))
+        tools.assert_equal(7, len(self._rows()))
+        tools.assert_equal(0, self.table.bulk_insert([]))
+
+    def test_bulk_update(self):
+        now, before, long_ago = job_env.ago(0), job_env.ago(60), \
+            job_env.ago(120)
+        self.table.bulk_insert([{'name': 'n-%02d' % i, 'last_run_at': now}
+                                for i in range(7)])
+        values = dict(('n-%02d' % i, {'last_run_at': before})
+                      for i in range(5))
+        values['n-05'] = {'last_run_at': long_ago}
+        values['nope'] = {'last_run_at': before}
+
+        tools.assert_equal(6, self.table.bulk_update(values, batch_size=2))
+
+        rows = self._rows()
+        tools.assert_equal([before] * 5,
+                           [rows['n-%02d' % i] for i in range(5)])
+        tools.assert_equal(long_ago, rows['n-05'])
+        tools.assert_equal(now, rows['n-06'])
+
+    def test_bulk_update_where(self):
+        now = job_env.ago(0)
+        self.table.bulk_insert([{'name': 'a', 'last_run_at': now},
+                                {'name': 'b', 'last_run_at': now}])
+        count = self.table.bulk_update(
+            {'a': {'updated': now}, 'b': {'updated': now}},
+            where=lambda t: t.name != 'b')
+        tools.assert_equal(1, count)
+        tools.assert_equal(None, self.table.get('b')['updated'])
@@ -0,0 +1,54 @@
+import threading
+
+from gevent import Timeout
+from nose import tools
+
+import job_env  # noqa
+from wumai.common import local
+from wumai.server.executor import GeventExecutor, ThreadExecutor
+
+
+class TestThreadExecutor:
+
+    def setup(self):
+        self.executor = ThreadExecutor(2)
+
+    def test_run(self):
+        tools.assert_equal(1, self.executor.run(lambda: 1, 1))
+
+        def boom():
+            raise ValueError('boom')
+        with tools.assert_raises(ValueError):
+            self.executor.run(boom, 1)
+
+    def test_run_keeps_the_context_id(self):
+        local.set_context_id('ctx-1')
+        try:
+            tools.assert_equal('ctx-1',
+                               self.executor.run(local.get_context_id, 1))
+        finally:
+            local.clear_context()
+
+    def test_timed_out_try_is_waited_for(self):
+        release = threading.Event()
+        returned = []
+
+        def try_():
+            release.wait()
+            returned.append(True)
+            return 1
+
+        threading.Timer(0.3, release.set).start()
+        with tools.assert_raises(Timeout):
+            self.executor.run(try_, 0.1)
+        # Timeout is raised once the try returned, never before.
+        tools.assert_equal([True], returned)
+
+
+class TestGeventExecutor:
+
+    def test_run(self):
+        executor = GeventExecutor(1)
+        tools.assert_equal(1, executor.run(lambda: 1, 1))
+        with tools.assert_raises(Timeout):
+            executor.run(lambda: executor.sleep(1), 0.1)
@@ -0,0 +1,74 @@
+import mock
+from nose import tools
+
+import job_env
+from wumai import db
+from wumai.common import db as common_db
+from wumai.model import base
+from wumai.model.job import job as job_model
+
+
+class TestArchive:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def _job(self, status, days):
+        job_id = job_model.create('Foo')
+        self.db.job.update(job_id, status=status,
+                           updated=job_env.ago(days * 86400))
+        return job_id
+
+    def _ids(self, table):
+        return sorted(row['id'] for row in table.select(fields=['id']))
+
+    def test_cutoff(self):
+        old = [self._job(job_model.JOB_STATUS_FINISHED, 31),
+               self._job(job_model.JOB_STATUS_ERROR, 31)]
+        kept = [self._job(job_model.JOB_STATUS_FINISHED, 29),
+                self._job(job_model.JOB_STATUS_PENDING, 31),
+                self._job(job_model.JOB_STATUS_RUNNING, 31)]
+
+        tools.assert_equal(2, job_model.archive(days=30))
+
+        tools.assert_equal(sorted(old), self._ids(self.db.job_archive))
+        tools.assert_equal(sorted(kept), self._ids(self.db.job))
+        tools.assert_equal(job_model.JOB_STATUS_ERROR,
+                           self.db.job_archive.get(old[1])['status'])
+
+    def test_batches(self):
+        old = [self._job(job_model.JOB_STATUS_FINISHED, 31)
+               for i in range(7)]
+
+        with mock.patch.object(common_db.Table, 'move_to',
+                               autospec=True,
+                               side_effect=common_db.Table.move_to) as move:
+            tools.assert_equal(7, job_model.archive(days=30, batch_size=3))
+        tools.assert_equal(3, move.call_count)
+        tools.assert_equal(sorted(old), self._ids(self.db.job_archive))
+        tools.assert_equal([], self._ids(self.db.job))
+
+    def test_rollback_when_delete_fails(self):
+        old = [self._job(job_model.JOB_STATUS_FINISHED, 31)
+               for i in range(2)]
+
+        with mock.patch.object(self.db.job, 'delete_any',
+                               side_effect=RuntimeError('boom')):
+            with tools.assert_raises(RuntimeError):
+                job_model.archive(days=30)
+
+        tools.assert_equal([], self._ids(self.db.job_archive))
+        tools.assert_equal(sorted(old), self._ids(self.db.job))
+
+    def test_in_a_transaction(self):
+        old = self._job(job_model.JOB_STATUS_FINISHED, 31)
+
+        # batches join the caller's transaction, which rolls them back.
+        with tools.assert_raises(RuntimeError):
+            with base.open_transaction(db.DB):
+                tools.assert_equal(1, job_model.archive(days=30))
+                job_model.create('Foo')
+                raise RuntimeError('boom')
+
+        tools.assert_equal([], self._ids(self.db.job_archive))
+        tools.assert_equal([old], self._ids(self.db.job))
@@ -0,0 +1,71 @@
+import mock
+from nose import tools
+
+import job_env
+from wumai.model.job import job as job_model
+
+
+class TestClaim:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def test_claim_due_jobs_in_priority_order(self):
+        low = job_model.create('Foo', priority=job_model.JOB_PRIORITY_LOW)
+        high = job_model.create('Foo', priority=job_model.JOB_PRIORITY_HIGH)
+        normal = job_model.create('Foo')
+        job_model.create('Foo', run_at=job_env.ago(-3600))
+
+        jobs = job_model.claim(10, 'w1', lease=60)
+
+        tools.assert_equal([high, normal, low], [j['id'] for j in jobs])
+        for j in jobs:
+            row = self.db.job.get(j['id'])
+            tools.assert_equal(job_model.JOB_STATUS_RUNNING, row['status'])
+            tools.assert_equal('w1', row['owner'])
+            tools.assert_true(row['lease_expires'] > job_env.ago(0))
+
+    def test_claim_limit_and_quotas(self):
+        for i in range(3):
+            job_model.create('Slow')
+        foo = job_model.create('Foo')
+
+        jobs = job_model.claim(10, 'w1', quotas={'Slow': 1})
+        tools.assert_equal(2, len(jobs))
+        tools.assert_in(foo, [j['id'] for j in jobs])
+
+        # a full action is not claimed, nothing is claimed twice.
+        tools.assert_equal([], job_model.claim(10, 'w2',
+                                               quotas={'Slow': 0}))
+        tools.assert_equal(1, len(job_model.claim(1, 'w3')))
+        tools.assert_equal(1, len(job_model.claim(10, 'w4')))
+        tools.assert_equal([], job_model.claim(10, 'w5'))
+
+    def test_claim_conflict_rolls_back_the_batch(self):
+        first = job_model.create('Foo')
+        second = job_model.create('Foo')
+
+        update_any = job_model.Job.update_any
+
+        def steal(where, **values):
+            # another worker claims the first job after our select.
+            self.db.engine.execute(
+                self.db.job.t.update()
+                .where(self.db.job.c.id == first)
+                .values(status=job_model.JOB_STATUS_RUNNING, owner='w2'))
+            return update_any(where, **values)
+
+        with mock.patch.object(job_model.Job, 'update_any',
+                               side_effect=steal):
+            tools.assert_equal([], job_model.claim(10, 'w1'))
+
+        row = self.db.job.get(first)
+        tools.assert_equal('w2', row['owner'])
+
+        # our update of the second job is rolled back.
+        row = self.db.job.get(second)
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+        tools.assert_equal(None, row['owner'])
+
+        tools.assert_equal([second],
+                           [j['id'] for j in job_model.claim(10, 'w1')])
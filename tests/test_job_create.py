@@ -0,0 +1,40 @@
+import json
+
+from nose import tools
+
+import job_env
+from wumai import error
+from wumai.model.job import job as job_model
+
+
+class TestCreateMany:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def test_create_many(self):
+        params_list = [{'n': i} for i in range(7)]
+        ids = job_model.create_many('Foo', params_list, priority=5,
+                                    batch_size=3)
+
+        tools.assert_equal(7, len(set(ids)))
+        for job_id, params in zip(ids, params_list):
+            row = self.db.job.get(job_id)
+            tools.assert_equal(params, json.loads(row['params']))
+            tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+            tools.assert_equal(5, row['priority'])
+        tools.assert_equal([], job_model.create_many('Foo', []))
+
+    def test_create_many_depending(self):
+        a = job_model.create('Foo')
+        ids = job_model.create_many('Foo', [{}, {}], depends_on=[a])
+
+        for job_id in ids:
+            tools.assert_equal(job_model.JOB_STATUS_WAITING,
+                               self.db.job.get(job_id)['status'])
+        tools.assert_equal(2, len(self.db.job_dependency.select()))
+
+    def test_create_many_unknown_retry_policy(self):
+        with tools.assert_raises(error.InvalidRequestParameter):
+            job_model.create_many('Foo', [{}], retry_policy='nope')
+        tools.assert_equal([], self.db.job.select())
@@ -0,0 +1,113 @@
+import json
+
+import mock
+from nose import tools
+from sqlalchemy.exc import IntegrityError
+
+import job_env
+from wumai.model.job import job as job_model
+
+
+class TestDedupe:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.worker = job_env.FakeWorker('w1')
+
+    def _jobs(self):
+        return self.db.job.select()
+
+    def _params(self, job_id):
+        return json.loads(self.db.job.get(job_id)['params'])
+
+    def test_hit(self):
+        a = job_model.create('Foo', dedupe_key='req-1')
+        tools.assert_equal(a, job_model.create('Foo', dedupe_key='req-1'))
+        b = job_model.create('Foo', dedupe_key='req-2')
+
+        tools.assert_not_equal(a, b)
+        tools.assert_equal(2, len(self._jobs()))
+
+    def test_running_job_holds_the_key(self):
+        a = job_model.create('Foo', dedupe_key='req-1')
+        job_model.claim(10, 'w1')
+        tools.assert_equal(a, job_model.create('Foo', dedupe_key='req-1'))
+
+    def test_key_released_on_settle(self):
+        a = job_model.create('Foo', dedupe_key='req-1')
+        b = job_model.create('Boom', dedupe_key='req-2', try_max=1)
+        for job in job_model.claim(10, 'w1'):
+            job_model.execute(job, self.worker)
+
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED,
+                           self.db.job.get(a)['status'])
+        tools.assert_equal(job_model.JOB_STATUS_ERROR,
+                           self.db.job.get(b)['status'])
+        for job_id in [a, b]:
+            tools.assert_equal(None, self.db.job.get(job_id)['dedupe_key'])
+
+        tools.assert_not_in(job_model.create('Foo', dedupe_key='req-1'),
+                            [a, b])
+        tools.assert_not_in(job_model.create('Foo', dedupe_key='req-2'),
+                            [a, b])
+
+    def test_key_kept_on_retry(self):
+        a = job_model.create('Boom', dedupe_key='req-1', try_max=2)
+        job_model.execute(job_model.claim(10, 'w1')[0], self.worker)
+
+        tools.assert_equal(job_model.JOB_STATUS_PENDING,
+                           self.db.job.get(a)['status'])
+        tools.assert_equal(a, job_model.create('Foo', dedupe_key='req-1'))
+
+    def test_integrity_error_retry(self):
+        a = job_model.create('Foo', dedupe_key='req-1')
+        deduplicate = job_model._deduplicate
+        calls = []
+
+        def racing(*args):
+            # the first check misses the job created by others meanwhile.
+            calls.append(args)
+            if len(calls) == 1:
+                return None
+            return deduplicate(*args)
+
+        with mock.patch.object(job_model, '_deduplicate', racing):
+            tools.assert_equal(a, job_model.create('Foo',
+                                                   dedupe_key='req-1'))
+        tools.assert_equal(2, len(calls))
+        tools.assert_equal(1, len(self._jobs()))
+
+    def test_integrity_error_without_holder_raises(self):
+        job_model.create('Foo', dedupe_key='req-1')
+
+        with mock.patch.object(job_model, '_deduplicate',
+                               return_value=None):
+            with tools.assert_raises(IntegrityError):
+                job_model.create('Foo', dedupe_key='req-1')
+
+    def test_coalesce_merges_resources(self):
+        a = job_model.create('Foo', params={'resource_ids': ['r-1', 'r-2']},
+                             dedupe_key='sync', coalesce=True)
+        b = job_model.create('Foo', params={'resource_ids': ['r-2', 'r-3']},
+                             dedupe_key='sync', coalesce=True)
+        c = job_model.create('Foo', params={}, dedupe_key='sync',
+                             coalesce=True)
+
+        tools.assert_equal(a, b)
+        tools.assert_equal(a, c)
+        tools.assert_equal(['r-1', 'r-2', 'r-3'],
+                           self._params(a)['resource_ids'])
+
+    def test_coalesce_into_a_running_job_takes_the_key(self):
+        a = job_model.create('Foo', params={'resource_ids': ['r-1']},
+                             dedupe_key='sync', coalesce=True)
+        job_model.claim(10, 'w1')
+
+        b = job_model.create('Foo', params={'resource_ids': ['r-2']},
+                             dedupe_key='sync', coalesce=True)
+
+        tools.assert_not_equal(a, b)
+        tools.assert_equal(None, self.db.job.get(a)['dedupe_key'])
+        tools.assert_equal('sync', self.db.job.get(b)['dedupe_key'])
+        tools.assert_equal(['r-1'], self._params(a)['resource_ids'])
+        tools.assert_equal(['r-2'], self._params(b)['resource_ids'])
@@ -0,0 +1,113 @@
+from nose import tools
+
+import job_env
+from wumai.model.job import job as job_model
+
+
+class TestDependency:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.worker = job_env.FakeWorker('w1')
+        self.claimed = {}
+
+    def _status(self, job_id):
+        return self.db.job.get(job_id)['status']
+
+    def _run(self, job_id):
+        for job in job_model.claim(10, 'w1'):
+            self.claimed[job['id']] = job
+        job_model.execute(self.claimed[job_id], self.worker)
+
+    def _failed(self):
+        return [job_id for topic, job_id in self.worker.notified
+                if topic == job_model.NOTIFY_JOB_FAILED]
+
+    def test_waiting_to_pending(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo', depends_on=[a])
+        tools.assert_equal(job_model.JOB_STATUS_WAITING, self._status(b))
+
+        self._run(a)
+
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(b))
+        tools.assert_equal([], self.db.job_dependency.select())
+
+    def test_failure_propagates_to_every_level(self):
+        a = job_model.create('Boom', try_max=1)
+        b = job_model.create('Foo', depends_on=[a])
+        c = job_model.create('Foo', depends_on=[b])
+        d = job_model.create('Foo')
+
+        self._run(a)
+
+        for job_id in [a, b, c]:
+            tools.assert_equal(job_model.JOB_STATUS_ERROR,
+                               self._status(job_id))
+        tools.assert_equal('dependency %s failed' % a,
+                           self.db.job.get(b)['error'])
+        tools.assert_equal('dependency %s failed' % b,
+                           self.db.job.get(c)['error'])
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, self._status(d))
+
+        # jobs failed by a dependency are notified as failed jobs.
+        tools.assert_equal([a, b, c], self._failed())
+        tools.assert_equal([], self.db.job_dependency.select())
+
+    def test_create_after_parents_settled(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Boom', try_max=1)
+        self._run(a)
+        self._run(b)
+
+        c = job_model.create('Foo', depends_on=[a])
+        d = job_model.create('Foo', depends_on=[a, b])
+
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(c))
+        tools.assert_equal(job_model.JOB_STATUS_ERROR, self._status(d))
+        tools.assert_equal([], self.db.job_dependency.select())
+
+    def test_fan_in(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        c = job_model.create('Foo', depends_on=[a, b])
+
+        self._run(a)
+        tools.assert_equal(job_model.JOB_STATUS_WAITING, self._status(c))
+
+        self._run(b)
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(c))
+
+    def test_fan_in_race(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        c = job_model.create('Foo', depends_on=[a, b])
+        self._run(a)
+        # b finished by another worker, without resolving c yet.
+        self.db.job.update(b, status=job_model.JOB_STATUS_FINISHED)
+
+        # both parents' workers resolve c, the compare and set from
+        # waiting lets only one of them move it.
+        tools.assert_equal(1, job_model._resolve([c]))
+        tools.assert_equal(0, job_model._resolve([c]))
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(c))
+
+    def test_resolve_waiting(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        c = job_model.create('Foo', depends_on=[a])
+        d = job_model.create('Foo', depends_on=[b])
+        e = job_model.create('Foo', depends_on=[a, job_model.create('Foo')])
+
+        # parents settled by workers died before resolving their children.
+        self.db.job.update(a, status=job_model.JOB_STATUS_FINISHED)
+        self.db.job.update(b, status=job_model.JOB_STATUS_ERROR)
+
+        tools.assert_equal(2, job_model.resolve_waiting(worker=self.worker))
+
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(c))
+        tools.assert_equal(job_model.JOB_STATUS_ERROR, self._status(d))
+        tools.assert_equal(job_model.JOB_STATUS_WAITING, self._status(e))
+        tools.assert_equal([d], self._failed())
+
+        tools.assert_equal(0, job_model.resolve_waiting(worker=self.worker))
@@ -0,0 +1,159 @@
+import json
+import time
+import threading
+
+from nose import tools
+
+import job_env
+from wumai.model.job import job as job_model
+from wumai.server.executor import ThreadExecutor
+
+
+class TestLease:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.worker = job_env.FakeWorker('w1')
+
+    def _status(self, job_id):
+        return self.db.job.get(job_id)['status']
+
+    def _claim(self, owner='w1'):
+        return dict((j['id'], j) for j in job_model.claim(10, owner))
+
+    def test_renew_only_jobs_being_executed(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        self._claim()
+        expired = job_env.ago(10)
+        self.db.job.update_any(lambda t: t.id.in_([a, b]),
+                               lease_expires=expired)
+
+        tools.assert_equal(1, job_model.renew_leases('w1', [a]))
+        tools.assert_equal(0, job_model.renew_leases('w2', [b]))
+        tools.assert_equal(0, job_model.renew_leases('w1', []))
+
+        tools.assert_true(self.db.job.get(a)['lease_expires'] > expired)
+        tools.assert_equal(expired, self.db.job.get(b)['lease_expires'])
+
+        # the job not renewed is reaped.
+        tools.assert_equal(1, job_model.reap_expired())
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, self._status(a))
+        row = self.db.job.get(b)
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+        tools.assert_equal(None, row['owner'])
+
+    def test_reap_running_jobs_without_lease(self):
+        a = job_model.create('Foo')
+        job_model.update(a, status=job_model.JOB_STATUS_RUNNING)
+
+        tools.assert_equal(1, job_model.reap_expired())
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(a))
+
+    def test_release_leases(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        self._claim('w1')
+        c = job_model.create('Foo')
+        self._claim('w2')
+
+        tools.assert_equal(2, job_model.release_leases('w1'))
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(a))
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, self._status(b))
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, self._status(c))
+
+    def test_late_settle_is_dropped(self):
+        a = job_model.create('Foo', params={'n': 1})
+        job = self._claim('w1')[a]
+
+        # w1 loses its lease, w2 takes the job over.
+        self.db.job.update(a, lease_expires=job_env.ago(10))
+        job_model.reap_expired()
+        self._claim('w2')
+
+        job_model.execute(job, self.worker)
+
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, row['status'])
+        tools.assert_equal('w2', row['owner'])
+        tools.assert_equal('', row['result'])
+
+    def test_execute(self):
+        a = job_model.create('Foo', params={'n': 1})
+        job_model.execute(self._claim()[a], self.worker)
+
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED, row['status'])
+        tools.assert_equal({'n': 1}, json.loads(row['result']))
+        tools.assert_equal(None, row['lease_expires'])
+
+    def test_broken_params_fail_the_job(self):
+        a = job_model.create('Foo')
+        self.db.job.update(a, params='{broken')
+
+        job_model.execute(self._claim()[a], self.worker)
+
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_ERROR, row['status'])
+        tools.assert_equal(1, row['trys'])
+        tools.assert_in((job_model.NOTIFY_JOB_FAILED, a),
+                        self.worker.notified)
+
+    def test_unknown_retry_policy_fails_the_job(self):
+        a = job_model.create('Boom')
+        self.db.job.update(a, retry_policy='nope')
+
+        job_model.execute(self._claim()[a], self.worker)
+
+        tools.assert_equal(job_model.JOB_STATUS_ERROR, self._status(a))
+
+    def test_timed_out_try_in_a_thread(self):
+        worker = job_env.FakeWorker('w1', executor=ThreadExecutor(1))
+        a = job_model.create('Nap', params={'seconds': 0.5}, timeout=0.1,
+                             try_max=3, retry_policy='exponential')
+        done = threading.Event()
+        worker.executor.spawn(job_model.execute, self._claim()[a],
+                              done.set, worker=worker)
+
+        # timed out, but the try is still running: the job is neither
+        # retried nor released, its lease is renewed.
+        time.sleep(0.3)
+        tools.assert_equal([a], worker.executor.running_ids())
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, row['status'])
+        tools.assert_equal('w1', row['owner'])
+        tools.assert_equal(0, row['trys'])
+
+        tools.assert_true(done.wait(5))
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+        tools.assert_equal(1, row['trys'])
+        tools.assert_equal(None, row['lease_expires'])
+        tools.assert_in((job_model.NOTIFY_JOB_FAILED, a), worker.notified)
+
+    def test_soft_deadline_is_seen_by_the_action(self):
+        worker = job_env.FakeWorker('w1', executor=ThreadExecutor(1))
+        a = job_model.create('Deadline')
+
+        job_model.execute(self._claim()[a], worker)
+
+        result = json.loads(self.db.job.get(a)['result'])
+        tools.assert_not_equal('None', result['soft_deadline'])
+
+    def test_soft_deadline_is_advisory(self):
+        # soft deadline at 0.5s, the try times out at 1s.
+        a = job_model.create('Nap', params={'seconds': 0.7}, timeout=1)
+
+        job_model.execute(self._claim()[a], self.worker)
+
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED, self._status(a))
+
+    def test_soft_timeout_option(self):
+        a = job_model.create('SoftNap', params={'seconds': 0.7}, timeout=1,
+                             try_max=1)
+
+        job_model.execute(self._claim()[a], self.worker)
+
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_ERROR, row['status'])
+        tools.assert_in('soft deadline', row['error'])
@@ -0,0 +1,58 @@
+from nose import tools
+
+import job_env
+from wumai import error
+from wumai.model import job as job_package
+from wumai.model.job import job as job_model
+
+
+class TestRunJob:
+
+    def setup(self):
+        self.db = job_env.setup()
+        self.worker = job_env.FakeWorker('w1')
+
+    def test_run_job_takes_a_pending_job_once(self):
+        a = job_model.create('Foo', params={'n': 1})
+
+        job_package.run_job(a, self.worker)
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED, row['status'])
+        tools.assert_equal(1, row['trys'])
+
+        # not pending any more, refused.
+        job_package.run_job(a, self.worker)
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED, row['status'])
+        tools.assert_equal(1, row['trys'])
+
+    def test_run_job_refuses_a_job_taken_by_others(self):
+        a = job_model.create('Foo')
+        job_model.claim(10, 'w2')
+
+        job_package.run_job(a, self.worker)
+
+        row = self.db.job.get(a)
+        tools.assert_equal(job_model.JOB_STATUS_RUNNING, row['status'])
+        tools.assert_equal('w2', row['owner'])
+
+    def test_run_job_not_found(self):
+        with tools.assert_raises(error.JobNotFound):
+            job_package.run_job('nope', self.worker)
+
+    def test_clean_job_releases_the_lease(self):
+        a = job_model.create('Foo')
+        b = job_model.create('Foo')
+        job_model.claim(1, 'w1')
+        running = [i for i in [a, b]
+                   if self.db.job.get(i)['status'] == 'running']
+
+        for job_id in [a, b]:
+            job_package.clean_job(job_id)
+
+        for job_id in [a, b]:
+            row = self.db.job.get(job_id)
+            tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+            tools.assert_equal(None, row['owner'])
+            tools.assert_equal(None, row['lease_expires'])
+        tools.assert_equal(1, len(running))
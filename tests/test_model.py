@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+
+import sqlalchemy
+from nose import tools
+
+import job_env
+from wumai.common import db as common_db
+from wumai.common.model import Model
+
+
+class TestModel:
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp(dir=job_env.DIRECTORY)
+        strategy = 'sqlite:///%s' % os.path.join(self.directory, 'a.db')
+        engine = sqlalchemy.create_engine(strategy)
+        engine.execute('create table item (id varchar(32) primary key, '
+                       'name varchar(32), deleted integer)')
+        engine.dispose()
+        self.database = common_db.Database(strategy)
+
+        table = self.database.item
+
+        class Item(Model):
+            deletable = False
+
+            @classmethod
+            def db(cls):
+                return table
+
+        self.Item = Item
+
+    def teardown(self):
+        self.database.close()
+        shutil.rmtree(self.directory)
+
+    def _names(self):
+        rows = self.database.item.select(order_by='id')
+        return [(row['id'], row['name'], row['deleted']) for row in rows]
+
+    def test_bulk_insert(self):
+        self.Item.bulk_insert([{'id': 'a', 'name': 'x'},
+                               {'id': 'b', 'name': 'y', 'deleted': 1}])
+        tools.assert_equal([('a', 'x', 0), ('b', 'y', 1)], self._names())
+
+    def test_bulk_update_skips_deleted_rows(self):
+        self.Item.bulk_insert([{'id': i, 'name': 'x'} for i in 'abc'])
+        self.Item.delete('b')
+
+        count = self.Item.bulk_update({'a': {'name': 'y'},
+                                       'b': {'name': 'y'},
+                                       'c': {'name': 'z'}})
+
+        tools.assert_equal(2, count)
+        tools.assert_equal([('a', 'y', 0), ('b', 'x', 1), ('c', 'z', 0)],
+                           self._names())
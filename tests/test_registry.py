@@ -0,0 +1,56 @@
+import sys
+import types
+
+from nose import tools
+
+import job_env  # noqa
+from wumai.model.job import registry
+from wumai.model.job.registry import Registry
+
+
+class TestRegistry:
+
+    def setup(self):
+        self.registry = Registry('tests.registry_actions')
+
+    def test_get(self):
+        foo = self.registry.get('Foo')
+        tools.assert_equal('foo', foo({}))
+        tools.assert_equal(None, foo.timeout)
+        tools.assert_equal(None, foo.retry_policy)
+        tools.assert_false(foo.soft_timeout)
+        tools.assert_is(foo, self.registry.get('Foo'))
+
+    def test_options(self):
+        slow = self.registry.get('Slow')
+        tools.assert_equal(60, slow.timeout)
+        tools.assert_equal('exponential', slow.retry_policy)
+        tools.assert_true(slow.soft_timeout)
+
+    def test_callables(self):
+        tools.assert_equal('partial', self.registry.get('Partial')({}))
+        tools.assert_equal('callable', self.registry.get('Instance')({}))
+
+    def test_not_actions(self):
+        # imported functions, private ones and other attributes.
+        for name in ['SnakeCase', 'Action', 'Echo', '_echo', 'NotCallable',
+                     'Functools', 'Nope']:
+            tools.assert_equal(None, self.registry.get(name))
+        tools.assert_equal(['Action', 'SnakeCase'],
+                           self.registry.unknown(['Foo', 'SnakeCase',
+                                                  'Action']))
+
+    def test_unknown_option(self):
+        with tools.assert_raises(ValueError):
+            registry.action(retries=3)
+
+    def test_unknown_retry_policy(self):
+        module = types.ModuleType('tests.bad_actions')
+        module.foo = registry.action(retry_policy='nope')(lambda p: p)
+        module.foo.__module__ = module.__name__
+        sys.modules[module.__name__] = module
+        try:
+            with tools.assert_raises(ValueError):
+                Registry(module.__name__)
+        finally:
+            del sys.modules[module.__name__]
@@ -0,0 +1,30 @@
+from nose import tools
+
+import job_env  # noqa
+from wumai import error
+from wumai.model.job import retry
+
+
+class TestExponential:
+
+    def setup(self):
+        self.policy = retry.get('exponential')
+
+    def test_permanent_errors_are_not_retried(self):
+        for ex in [error.InvalidRequestParameter(),
+                   error.ValidationError(),
+                   error.ResourceActionUnsupported('r-1'),
+                   error.ResourceNotBelongsToProject('r-1')]:
+            tools.assert_false(self.policy.retryable(ex))
+
+    def test_transient_client_errors_are_retried(self):
+        for ex in [error.ResourceIsBusy('r-1'),
+                   error.ResourceNotFound('r-1'),
+                   error.ResourceActionForbiden('r-1'),
+                   ValueError()]:
+            tools.assert_true(self.policy.retryable(ex))
+
+    def test_delay(self):
+        policy = retry.ExponentialRetry(max_delay=50, jitter=False)
+        tools.assert_equal([10, 20, 40, 50],
+                           [policy.delay({}, n) for n in range(1, 5)])
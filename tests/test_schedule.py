@@ -0,0 +1,64 @@
+import datetime
+
+import mock
+from nose import tools
+
+import job_env
+from wumai.model.job import schedule as schedule_model
+from wumai.model.job.schedule import Schedule
+
+
+class TestSchedule:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def _jobs(self):
+        return self.db.job.select()
+
+    def test_times(self):
+        s = Schedule('s', 'Foo', every=600)
+        start = datetime.datetime(2024, 1, 1, 0, 5)
+        end = datetime.datetime(2024, 1, 1, 0, 30)
+        tools.assert_equal([datetime.datetime(2024, 1, 1, 0, 10),
+                            datetime.datetime(2024, 1, 1, 0, 20),
+                            datetime.datetime(2024, 1, 1, 0, 30)],
+                           s.times(start, end))
+
+    def test_invalid(self):
+        for kwargs in [{}, {'every': 60, 'cron': '* * * * *'},
+                       {'every': 0}, {'cron': '* *'}]:
+            with tools.assert_raises(ValueError):
+                Schedule('s', 'Foo', **kwargs)
+
+    def test_new_schedule_starts_from_now(self):
+        s = Schedule('s', 'Foo', every=60)
+        tools.assert_equal(1, schedule_model.materialize([s], ahead=60))
+        tools.assert_equal(1, len(self._jobs()))
+
+        # the same times are not created again.
+        tools.assert_equal(0, schedule_model.materialize([s], ahead=60))
+        tools.assert_equal(1, len(self._jobs()))
+
+    def test_no_backfill(self):
+        self.db.job_schedule.insert(name='s', last_run_at=job_env.ago(86400))
+        s = Schedule('s', 'Foo', every=60)
+
+        # only the times of the last and the next 60 seconds.
+        tools.assert_equal(2, schedule_model.materialize([s], ahead=60))
+        tools.assert_equal(2, len(self._jobs()))
+        last = self.db.job_schedule.get('s')['last_run_at']
+        tools.assert_true(last > job_env.ago(0))
+
+    def test_cas_on_last_run_at(self):
+        self.db.job_schedule.insert(name='s', last_run_at=job_env.ago(120))
+        stale = self.db.job_schedule.get('s')
+        s = Schedule('s', 'Foo', every=60)
+
+        tools.assert_equal(2, schedule_model.materialize([s], ahead=60))
+
+        # a worker which read last_run_at before the first one moved it.
+        with mock.patch.object(self.db.job_schedule, 'get',
+                               return_value=stale):
+            tools.assert_equal(0, schedule_model.materialize([s], ahead=60))
+        tools.assert_equal(2, len(self._jobs()))
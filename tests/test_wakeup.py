@@ -0,0 +1,119 @@
+import os
+import socket
+import tempfile
+import threading
+
+import mock
+from nose import tools
+
+import job_env
+from wumai import wakeup
+from wumai.common.wakeup import RedisChannel, SocketChannel
+from wumai.server import worker as worker_module
+from wumai.server.executor import ThreadExecutor
+
+
+class Stop(BaseException):
+    pass
+
+
+class TestSocketChannel:
+
+    def setup(self):
+        self.directory = tempfile.mkdtemp(dir=job_env.DIRECTORY)
+
+    def test_publish_listen(self):
+        channel = SocketChannel(os.path.join(self.directory, 'new'), 'a')
+        received = []
+        event = threading.Event()
+
+        def on_message(message):
+            received.append(message)
+            event.set()
+
+        listener = threading.Thread(target=channel.listen,
+                                    args=(on_message,))
+        listener.daemon = True
+        listener.start()
+        for i in range(100):
+            if os.path.exists(channel._socket_path()):
+                break
+            event.wait(0.01)
+
+        # channels of other names are not woken up.
+        SocketChannel(channel.directory, 'b').publish('other')
+        channel.publish('hello')
+
+        tools.assert_true(event.wait(5))
+        tools.assert_equal(['hello'], received)
+
+    def test_stale_socket_is_removed(self):
+        channel = SocketChannel(self.directory, 'a')
+        path = os.path.join(self.directory, 'a.99999.sock')
+        # a listener died without removing its socket file.
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        sock.close()
+        tools.assert_true(os.path.exists(path))
+
+        channel.publish('hello')
+
+        tools.assert_false(os.path.exists(path))
+
+    def test_publish_without_listeners(self):
+        SocketChannel(os.path.join(self.directory, 'none'), 'a').publish()
+
+
+class TestRedisChannel:
+
+    def test_publish_listen(self):
+        connection = mock.Mock()
+        pubsub = connection.pubsub.return_value
+        pubsub.listen.return_value = [{'data': 'a'}, {'data': 'b'}]
+        channel = RedisChannel(connection, 'jobs')
+
+        channel.publish('x')
+        connection.publish.assert_called_once_with('jobs', 'x')
+
+        received = []
+        channel.listen(received.append)
+        tools.assert_equal(['a', 'b'], received)
+        pubsub.subscribe.assert_called_once_with('jobs')
+        tools.assert_true(pubsub.close.called)
+
+
+class TestListenWakeup:
+
+    def setup(self):
+        job_env.setup()
+        with mock.patch.object(ThreadExecutor, 'signal'):
+            self.worker = worker_module.Worker(
+                gevent=False, poll_interval=3,
+                action_module='tests.job_actions')
+
+    def test_reconnect_after_failure(self):
+        calls = []
+
+        def listen(callback):
+            calls.append(callback)
+            if len(calls) == 1:
+                raise socket.error('broken')
+            callback('')
+            raise Stop()
+
+        with mock.patch.object(wakeup, 'CHANNEL', mock.Mock()), \
+                mock.patch.object(wakeup, 'listen', side_effect=listen), \
+                mock.patch.object(self.worker.executor, 'sleep') as sleep:
+            with tools.assert_raises(Stop):
+                self.worker._listen_wakeup()
+
+        # backs off once, then listens again.
+        sleep.assert_called_once_with(3)
+        tools.assert_equal(2, len(calls))
+        tools.assert_true(self.worker.wakeup.is_set())
+
+    def test_no_channel(self):
+        with mock.patch.object(wakeup, 'CHANNEL', None), \
+                mock.patch.object(wakeup, 'listen') as listen:
+            self.worker._listen_wakeup()
+        tools.assert_false(listen.called)
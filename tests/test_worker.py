@@ -0,0 +1,90 @@
+import time
+
+import mock
+from nose import tools
+
+import job_env
+from wumai.model.job import execute_job
+from wumai.model.job import job as job_model
+from wumai.server import worker as worker_module
+from wumai.server.executor import GeventExecutor, ThreadExecutor
+
+
+class TestSupervisor:
+
+    def test_notifiers_reach_child_workers(self):
+        noti = mock.Mock()
+        supervisor = worker_module.Supervisor(2, exec_size=3)
+        tools.assert_is(supervisor,
+                        supervisor.add_notifiers([noti]))
+
+        with mock.patch.object(worker_module, 'Worker') as Worker, \
+                mock.patch.object(worker_module.bootstrap, 'init'), \
+                mock.patch.object(worker_module.signal, 'signal'), \
+                mock.patch.object(worker_module.os, 'fork',
+                                  return_value=0), \
+                mock.patch.object(worker_module.os, '_exit') as _exit:
+            # the child branch of fork.
+            supervisor._spawn()
+
+        Worker.assert_called_once_with(exec_size=3)
+        Worker.return_value.add_notifiers.assert_called_once_with([noti])
+        Worker.return_value.start.assert_called_once_with()
+        _exit.assert_called_once_with(0)
+
+
+class TestDrain:
+
+    def setup(self):
+        self.db = job_env.setup()
+
+    def _worker(self, **kwargs):
+        with mock.patch.object(GeventExecutor, 'signal'), \
+                mock.patch.object(ThreadExecutor, 'signal'):
+            return worker_module.Worker(action_module='tests.job_actions',
+                                        drain_timeout=0.2, **kwargs)
+
+    def _start(self, worker, seconds):
+        job_id = job_model.create('Nap', params={'seconds': seconds})
+        job = job_model.claim(1, worker.worker_id, worker.lease)[0]
+        worker.executor.spawn(execute_job, job, worker._on_job_done,
+                              worker=worker)
+        return job_id
+
+    def _assert_released(self, job_id):
+        row = self.db.job.get(job_id)
+        tools.assert_equal(job_model.JOB_STATUS_PENDING, row['status'])
+        tools.assert_equal(None, row['owner'])
+        tools.assert_equal(None, row['lease_expires'])
+        tools.assert_equal(0, row['trys'])
+
+    def test_drain_kills_jobs_at_timeout(self):
+        worker = self._worker()
+        job_id = self._start(worker, 5)
+
+        started = time.time()
+        worker._drain([])
+
+        tools.assert_true(time.time() - started < 2)
+        tools.assert_equal([], worker.executor.running_ids())
+        self._assert_released(job_id)
+
+    def test_drain_in_threads(self):
+        worker = self._worker(gevent=False)
+        job_id = self._start(worker, 0.5)
+
+        worker._drain([])
+        self._assert_released(job_id)
+
+        # the thread can not be killed, what it returns is dropped.
+        tools.assert_true(worker.executor.join(5))
+        self._assert_released(job_id)
+
+    def test_drain_waits_for_jobs(self):
+        worker = self._worker()
+        job_id = self._start(worker, 0.05)
+
+        worker._drain([])
+
+        tools.assert_equal(job_model.JOB_STATUS_FINISHED,
+                           self.db.job.get(job_id)['status'])
@@ -0,0 +1,53 @@
+from wumai import config
+from wumai import db
+from wumai import error
+from wumai.common import blob
+
+STORE = None
+
+THRESHOLD = 4096
+
+PREFIX = 'blob:'
+
+
+def setup():
+    """
+    store large job params and results out of the job table,
+    in directory blob_dir, or else in table blob_table.
+    """
+    global STORE
+    global THRESHOLD
+
+    if config.CONF.blob_dir:
+        STORE = blob.FileStore(config.CONF.blob_dir)
+    elif config.CONF.blob_table:
+        STORE = blob.TableStore(getattr(db.DB, config.CONF.blob_table))
+
+    THRESHOLD = config.CONF.blob_threshold
+
+
+def pack(text):
+    """
+    return a reference to text if it is stored in blob store,
+    else text itself.
+    """
+    if STORE is None or text is None or len(text) < THRESHOLD:
+        return text
+
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return PREFIX + STORE.put(text)
+
+
+def unpack(text):
+    """
+    reverse of pack(), text is returned as it is if it is not a reference.
+    raise error.ServerInternalError if it is, but no store is configured.
+    """
+    if text and text.startswith(PREFIX):
+        if STORE is None:
+            raise error.ServerInternalError(
+                '%s is in a blob store, but neither blob_dir (BLOB_DIR) '
+                'nor blob_table (BLOB_TABLE) is configured' % text)
+        return STORE.get(text[len(PREFIX):])
+    return text
@@ -3,6 +3,8 @@ from gevent import monkey
 from wumai import config
 from wumai import db
 from wumai import cache
+from wumai import wakeup
+from wumai import blob
 
 GEVENT = False
 
@@ -17,6 +19,8 @@ def init():
     if config.CONF.redis_host:
         cache.setup()
 
+    blob.setup()
+
     if config.CONF.gevent:
         global GEVENT
         GEVENT = True
@@ -24,3 +28,6 @@ def init():
         # flask's auto loader
         # http://flask.pocoo.org/snippets/34/
         monkey.patch_all()
+
+    # setup after monkey patch, so that the listener sockets are cooperative.
+    wakeup.setup()
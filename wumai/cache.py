@@ -1,5 +1,7 @@
 import os
+from wumai import config
 from wumai.common.rediscache import SimpleCache, cache_it_json
+from wumai.common.rediscache import RedisConnect, RedisNoConnException
 
 
 CACHE = cache_it_json
@@ -19,5 +21,21 @@ def get_cache_store(limit, expire):
     return cache
 
 
+def get_connection():
+    """
+    return a redis connection, or None if redis is not configured
+    or not reachable.
+    """
+    if not config.CONF.redis_host:
+        return None
+
+    try:
+        return RedisConnect(host=config.CONF.redis_host,
+                            port=config.CONF.redis_port,
+                            db=1).connect()
+    except RedisNoConnException:
+        return None
+
+
 def setup():
     pass
@@ -0,0 +1,92 @@
+"""
+content addressed blob stores, data is zlib compressed.
+
+    FileStore:  files in a local (or shared) directory.
+    TableStore: rows of a db table with columns (id, data).
+
+put(data) returns the key of data, the sha1 of it. putting the same data
+twice stores it once, so a blob may be shared by many jobs. blobs are never
+deleted, the store only grows.
+"""
+import os
+import zlib
+import errno
+import hashlib
+import tempfile
+
+
+def make_key(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class FileStore(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        # two levels, not too many files in one directory.
+        return os.path.join(self.directory, key[:2], key)
+
+    def put(self, data):
+        key = make_key(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+        # write to a temp file then rename, readers never see a partial one.
+        fd, temp = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data))
+            os.rename(temp, path)
+        except Exception:
+            os.remove(temp)
+            raise
+        return key
+
+    def get(self, key):
+        """
+        raise KeyError if no such blob.
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return zlib.decompress(f.read())
+        except IOError as ex:
+            if ex.errno == errno.ENOENT:
+                raise KeyError(key)
+            raise
+
+
+class TableStore(object):
+    def __init__(self, table):
+        """
+        table: wumai.common.db.Table with columns id and data.
+        """
+        self.table = table
+
+    def put(self, data):
+        key = make_key(data)
+        if self.table.get(key, fields=['id']) is None:
+            try:
+                self.table.insert(id=key, data=zlib.compress(data))
+            except Exception:
+                # inserted by others meanwhile.
+                if self.table.get(key, fields=['id']) is None:
+                    raise
+        return key
+
+    def get(self, key):
+        """
+        raise KeyError if no such blob.
+        """
+        row = self.table.get(key)
+        if row is None:
+            raise KeyError(key)
+        return zlib.decompress(row['data'])
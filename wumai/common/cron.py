@@ -0,0 +1,123 @@
+"""
+cron expressions, in UTC.
+
+    minute hour day-of-month month day-of-week
+
+fields are `*`, `5`, `1-5`, `*/15`, `1-30/5` or lists of them `0,30`.
+day-of-week is 0-7, both 0 and 7 are sunday. when both day-of-month and
+day-of-week are restricted, a day matching either of them matches, like
+the vixie cron. @yearly, @monthly, @weekly, @daily and @hourly are
+supported too.
+
+    Cron('*/5 * * * *').next(datetime.datetime.utcnow())
+"""
+import datetime
+
+MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# (min, max) of minute, hour, day of month, month and day of week.
+BOUNDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# no expression matches nothing for longer, e.g. 29th of february.
+MAX_YEARS = 8
+
+
+def _parse_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError('invalid step: %s' % field)
+        else:
+            step = 1
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = [int(v) for v in part.split('-', 1)]
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError('out of range [%d, %d]: %s' % (low, high, field))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron(object):
+    def __init__(self, expression):
+        """
+        raise ValueError if expression is invalid.
+        """
+        self.expression = expression
+        fields = MACROS.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError('cron expression needs 5 fields: %s' %
+                             expression)
+
+        try:
+            parsed = [_parse_field(field, low, high)
+                      for field, (low, high) in zip(fields, BOUNDS)]
+        except ValueError as ex:
+            raise ValueError('invalid cron expression %s, %s' %
+                             (expression, ex))
+
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # sunday is 0 and 7, python's weekday() of monday is 0.
+        self.weekdays = set((day - 1) % 7 for day in weekdays)
+
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _match_day(self, date):
+        in_days = date.day in self.days
+        in_weekdays = date.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next(self, after):
+        """
+        the first time matching the expression later than after.
+        """
+        t = after.replace(second=0, microsecond=0) + \
+            datetime.timedelta(minutes=1)
+        limit = after.year + MAX_YEARS
+
+        # skip a whole month, day or hour when it does not match.
+        while t.year <= limit:
+            if t.month not in self.months:
+                if t.month == 12:
+                    t = t.replace(year=t.year + 1, month=1, day=1,
+                                  hour=0, minute=0)
+                else:
+                    t = t.replace(month=t.month + 1, day=1, hour=0, minute=0)
+                continue
+
+            if not self._match_day(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+                continue
+
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+
+            if t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+                continue
+
+            return t
+
+        raise ValueError('cron expression never matches: %s' %
+                         self.expression)
@@ -1,10 +1,18 @@
+import os
+import glob
+import json
+import base64
+import cPickle as pickle
+import hashlib
 import logging
+import datetime
 from gevent import getcurrent
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.sql import and_, or_, not_
 import sqlalchemy
 from wumai.common import local
+from wumai.common import utils
 
 default_engine_settings = {
     'encoding': 'utf8',
@@ -22,6 +30,79 @@ default_engine_settings = {
 }
 
 
+TYPE_CONVERTS = {
+    sqlalchemy.CHAR: str,
+    sqlalchemy.VARCHAR: str,
+    sqlalchemy.DATE: str,
+    sqlalchemy.DATETIME: str,
+    sqlalchemy.INT: int,
+    sqlalchemy.INTEGER: int,
+    sqlalchemy.Integer: int,
+    sqlalchemy.TEXT: str,
+    sqlalchemy.NCHAR: str,
+    sqlalchemy.NVARCHAR: str,
+    sqlalchemy.BOOLEAN: bool,
+    sqlalchemy.BigInteger: int,
+    sqlalchemy.Binary: str,
+    sqlalchemy.Boolean: bool,
+    sqlalchemy.CHAR: str,
+    sqlalchemy.CLOB: str,
+    sqlalchemy.DATETIME: str,
+    sqlalchemy.DECIMAL: float,
+    sqlalchemy.Date: str,
+    sqlalchemy.DateTime: str,
+    sqlalchemy.Enum: int,
+    sqlalchemy.FLOAT: float,
+    sqlalchemy.Float: float,
+    sqlalchemy.NUMERIC: str,
+    sqlalchemy.SMALLINT: int,
+    sqlalchemy.String: str,
+    sqlalchemy.TEXT: str,
+    sqlalchemy.TIME: str,
+    sqlalchemy.TIMESTAMP: str,
+    sqlalchemy.Time: str,
+    sqlalchemy.Unicode: str,
+    sqlalchemy.UnicodeText: str,
+    sqlalchemy.types._Binary: str,
+}
+
+
+COMPILED_CACHE_SIZE = 500
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(values):
+    """
+    encode key values of a row to an opaque url safe string.
+    """
+    def default(obj):
+        if isinstance(obj, datetime.datetime):
+            return {'$datetime': obj.strftime(CURSOR_DATETIME_FORMAT)}
+        raise TypeError('could not encode %r in cursor' % obj)
+
+    return base64.urlsafe_b64encode(json.dumps(values, default=default))
+
+
+def decode_cursor(cursor):
+    def object_hook(obj):
+        if '$datetime' in obj:
+            return datetime.datetime.strptime(obj['$datetime'],
+                                              CURSOR_DATETIME_FORMAT)
+        return obj
+
+    # repr, the message is str(ex) of callers, a unicode one may not encode.
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)),
+                            object_hook=object_hook)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('invalid cursor %r' % cursor)
+
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor %r' % cursor)
+    return values
+
+
 def generate_engine_configuration(db, host='localhost', port=3306,
                                   user='root', passwd=''):
     if passwd:
@@ -34,7 +115,15 @@ def generate_engine_configuration(db, host='localhost', port=3306,
 class Database(object):
     log = logging.getLogger('database')
 
-    def __init__(self, strategy, only=None, but=[], **params):
+    def __init__(self, strategy, only=None, but=[], lazy=False,
+                 cache_dir=None, **params):
+        """
+        lazy: do not reflect tables at startup, reflect a table when it is
+              accessed as an attribute at the first time.
+        cache_dir: pickle reflected metadata into this directory, keyed by
+                   schema checksum. next startup loads it instead of
+                   reflecting, if the schema is not changed.
+        """
         settings = default_engine_settings.copy()
 
         if strategy.startswith('sqlite'):
@@ -43,6 +132,11 @@ class Database(object):
 
         settings.update(params)
 
+        # reuse compiled forms of statement templates in Table.
+        settings.setdefault('execution_options', {
+            'compiled_cache': sqlalchemy.util.LRUCache(COMPILED_CACHE_SIZE),
+        })
+
         self.engine = sqlalchemy.create_engine(strategy, **settings)
         self.strategy = strategy
 
@@ -63,11 +157,22 @@ class Database(object):
         tables = only if only else self.engine.table_names()
         if but:
             tables = [t for t in tables if t not in but]
-        self.meta.reflect(only=tables)
+
+        self.lazy = lazy
+        self._table_names = set(tables)
+
+        if cache_dir:
+            self._reflect_with_cache(tables, cache_dir)
+        elif not lazy:
+            self.meta.reflect(only=tables)
+
         self.base_model = declarative_base(bind=self.engine,
                                            metadata=self.meta)
 
-        self.generate_all_table()
+        if not lazy:
+            self.generate_all_table()
+
+        self.skip_locked = self._supports_skip_locked()
 
         # for convenience
         self.and_ = and_
@@ -80,6 +185,96 @@ class Database(object):
         else:
             return {}[1]
 
+    def __getattr__(self, name):
+        # only called when name is not set yet,
+        # which means the table is not reflected in lazy mode.
+        if not self.__dict__.get('lazy'):
+            raise AttributeError(name)
+        if name not in self.__dict__.get('_table_names', ()):
+            raise AttributeError(name)
+
+        self.meta.reflect(only=[name])
+        table = self._get_table(name)
+        setattr(self, name, table)
+        return table
+
+    def _reflect_with_cache(self, tables, cache_dir):
+        checksum = self._schema_checksum(tables)
+        if checksum is None:
+            self.log.info('schema checksum is not supported, reflect.')
+            self.meta.reflect(only=tables)
+            return
+
+        path = os.path.join(cache_dir, '%s%s.pickle' %
+                            (self._cache_prefix(), checksum))
+        try:
+            with open(path, 'rb') as f:
+                meta = pickle.load(f)
+        except Exception:
+            # missing or broken cache file, reflect and cache it.
+            self.meta.reflect(only=tables)
+            self._dump_meta(path)
+        else:
+            meta.bind = self.engine
+            self.meta = meta
+
+    def _dump_meta(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # write then rename, so other processes never read a partial file.
+        tmp = '%s.%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.meta, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+        # caches of old schemas of this database are useless, those of
+        # other databases sharing the directory are kept.
+        pattern = os.path.join(directory, '%s*.pickle' % self._cache_prefix())
+        for old in glob.glob(pattern):
+            if old != path:
+                with utils.silent():
+                    os.remove(old)
+
+    def _cache_prefix(self):
+        """
+        prefix of cache files of this database, by its url, which is hashed
+        so that the password is not in the file name.
+        """
+        return 'meta-%s-' % hashlib.sha1(self.strategy).hexdigest()[:12]
+
+    def _schema_checksum(self, tables):
+        """
+        a checksum of the definition of tables, which changes whenever
+        a table is created, dropped or altered.
+        """
+        dialect = self.engine.dialect.name
+        if dialect == 'mysql':
+            sqls = [
+                """SELECT table_name, column_name, ordinal_position,
+                          column_type, is_nullable, column_default, column_key
+                   FROM information_schema.columns
+                   WHERE table_schema = DATABASE()
+                   ORDER BY table_name, ordinal_position""",
+                """SELECT table_name, index_name, seq_in_index, column_name,
+                          non_unique
+                   FROM information_schema.statistics
+                   WHERE table_schema = DATABASE()
+                   ORDER BY table_name, index_name, seq_in_index""",
+            ]
+        elif dialect == 'sqlite':
+            sqls = ['SELECT type, name, sql FROM sqlite_master ORDER BY name']
+        else:
+            return None
+
+        digest = hashlib.sha1(sqlalchemy.__version__)
+        digest.update(repr(sorted(tables)))
+        for sql in sqls:
+            for row in self.engine.execute(sql):
+                digest.update(repr(tuple(row)))
+        return digest.hexdigest()
+
     def close(self):
         return self.engine.dispose()
 
@@ -91,10 +286,30 @@ class Database(object):
         echo_log.instance_logger(self.engine.pool, flag)
 
     def tables(self):
+        if self.lazy:
+            return list(self._table_names)
         return self.meta.tables.keys()
 
+    def _supports_skip_locked(self):
+        """
+        SELECT ... FOR UPDATE SKIP LOCKED is supported by
+        mysql >= 8.0.1, mariadb >= 10.6 and postgresql >= 9.5
+        """
+        dialect = self.engine.dialect
+        info = dialect.server_version_info or ()
+        version = tuple(v for v in info if isinstance(v, int))
+
+        if dialect.name == 'mysql':
+            if any('MariaDB' in str(v) for v in info):
+                return version >= (10, 6)
+            return version >= (8, 0, 1)
+        elif dialect.name == 'postgresql':
+            return version >= (9, 5)
+        else:
+            return False
+
     def generate_all_table(self):
-        for table_name in self.tables():
+        for table_name in self.meta.tables.keys():
             table = self._get_table(table_name)
             try:
                 setattr(self, table_name, table)
@@ -111,8 +326,11 @@ class Database(object):
 
     @staticmethod
     def _execute(session, sql, as_dictionary=True, start=0, length=0,
-                 is_count=False, raw=False):
-        if isinstance(sql, (str, unicode)):
+                 is_count=False, raw=False, params=None):
+        if params is not None:
+            # a statement template with its bind params.
+            result = session.execute(sql, params)
+        elif isinstance(sql, (str, unicode)):
             result = session.execute(sql)
         else:
             # in a case of selection object, it's same anyway.
@@ -130,7 +348,8 @@ class Database(object):
             # this is a couting sql
             return result.fetchone()[0]
         elif length > 0:
-            # fetch some rows.
+            # fetch some rows of a raw sql.
+            # Table pages its selections by OFFSET/LIMIT instead.
             if hasattr(result.cursor, 'scroll'):
                 if start >= result.rowcount:
                     return []
@@ -150,17 +369,30 @@ class Database(object):
 
     def drop_table(self, table):
         self.execute('drop table %s' % table)
-        self.meta.reflect()
-        delattr(self, table)
+        self._forget_table(table)
+        if not self.lazy:
+            self.meta.reflect()
 
     def rename_table(self, _from, to):
-        self.execute('rename table %s to %s' % (_from, to))
-        delattr(self, _from)
-        self.meta.reflect()
+        # ALTER TABLE ... RENAME TO works on mysql, postgresql and sqlite.
+        self.execute('alter table %s rename to %s' % (_from, to))
+        self._forget_table(_from)
+        self._table_names.add(to)
+        if self.lazy:
+            self.meta.reflect(only=[to])
+        else:
+            self.meta.reflect()
         table = self._get_table(to)
         setattr(self, to, table)
         return table
 
+    def _forget_table(self, table):
+        self._table_names.discard(table)
+        if table in self.meta.tables:
+            self.meta.remove(self.meta.tables[table])
+        if table in self.__dict__:
+            delattr(self, table)
+
 
 class Table(object):
 
@@ -179,49 +411,42 @@ class Table(object):
         self.or_ = or_
         self.not_ = not_
 
+        self.refresh()
+
+    def refresh(self):
+        """
+        compute field metadata and statement templates of the schema once,
+        call it again if the schema is reflected again.
+        """
+        fields = {}
+        for c in self.schema.columns:
+            name = c.name
+            primary = c.primary_key
+            type = self.convert_type(c.type)
+            nullable = c.nullable
+            default = c.default
+            fields[name] = (primary, type, nullable, default)
+        self._fields = fields
+
+        # columns of selections, keyed by frozenset of field names.
+        self._columns = {}
+
+        # templates are the same objects every time, so engine can reuse
+        # their compiled forms from its compiled_cache.
+        self._insert_statement = self.schema.insert()
+        self._get_statements = {}
+        if hasattr(self, 'primary'):
+            column = self.schema.c[self.primary]
+            self._primary_where = column == sqlalchemy.bindparam('_primary')
+            self._update_statement = self.schema.update(self._primary_where)
+
     def convert_type(self, column_type):
-        converts = {
-            sqlalchemy.CHAR: str,
-            sqlalchemy.VARCHAR: str,
-            sqlalchemy.DATE: str,
-            sqlalchemy.DATETIME: str,
-            sqlalchemy.INT: int,
-            sqlalchemy.INTEGER: int,
-            sqlalchemy.Integer: int,
-            sqlalchemy.TEXT: str,
-            sqlalchemy.NCHAR: str,
-            sqlalchemy.NVARCHAR: str,
-            sqlalchemy.BOOLEAN: bool,
-            sqlalchemy.BigInteger: int,
-            sqlalchemy.Binary: str,
-            sqlalchemy.Boolean: bool,
-            sqlalchemy.CHAR: str,
-            sqlalchemy.CLOB: str,
-            sqlalchemy.DATETIME: str,
-            sqlalchemy.DECIMAL: float,
-            sqlalchemy.Date: str,
-            sqlalchemy.DateTime: str,
-            sqlalchemy.Enum: int,
-            sqlalchemy.FLOAT: float,
-            sqlalchemy.Float: float,
-            sqlalchemy.NUMERIC: str,
-            sqlalchemy.SMALLINT: int,
-            sqlalchemy.String: str,
-            sqlalchemy.TEXT: str,
-            sqlalchemy.TIME: str,
-            sqlalchemy.TIMESTAMP: str,
-            sqlalchemy.Time: str,
-            sqlalchemy.Unicode: str,
-            sqlalchemy.UnicodeText: str,
-            sqlalchemy.types._Binary: str,
-        }
-
-        for type in converts:
+        for type in TYPE_CONVERTS:
             if isinstance(column_type, type):
-                return converts[type]
-        for type in converts:
+                return TYPE_CONVERTS[type]
+        for type in TYPE_CONVERTS:
             if issubclass(column_type.__class__, type):
-                return converts[type]
+                return TYPE_CONVERTS[type]
         raise ValueError('could not convert %s' % column_type)
 
     @property
@@ -245,15 +470,37 @@ class Table(object):
     @property
     # TODO: it's should not dic, it's should have keep suquence
     def fields(self):
-        fields = {}
-        for c in self.schema.columns:
-            name = c.name
-            primary = c.primary_key
-            type = self.convert_type(c.type)
-            nullable = c.nullable
-            default = c.default
-            fields[name] = (primary, type, nullable, default)
-        return fields
+        return self._fields
+
+    def _check_columns(self, values):
+        """
+        templates take bind params, which silently ignore unknown keys,
+        raise like insert().values() or update().values() does.
+        """
+        unknown = [name for name in values if name not in self.schema.c]
+        if unknown:
+            raise sqlalchemy.exc.CompileError(
+                'Unconsumed column names: %s' % ', '.join(sorted(unknown)))
+
+    def _has_expressions(self, values):
+        """
+        templates bind plain values only, values like `t.c.trys + 1` need
+        a statement of their own.
+        """
+        return any(isinstance(value,
+                              sqlalchemy.sql.expression.ClauseElement)
+                   for value in values.values())
+
+    def _get_columns(self, fields):
+        key = frozenset(fields) if fields else None
+        columns = self._columns.get(key)
+        if columns is None:
+            if fields:
+                columns = [c for c in self.schema.c if c.name in fields]
+            else:
+                columns = list(self.schema.c)
+            self._columns[key] = columns
+        return columns
 
     def make_where(self, wheresql):
         if isinstance(wheresql, dict):
@@ -285,10 +532,7 @@ class Table(object):
                             **params)
 
     def _select(self, where, fields, limit=None, order_by=None, **params):
-        if not fields:
-            fields = self.fields.keys()
-
-        columns = [c for c in self.schema.c if c.name in fields]
+        columns = self._get_columns(fields)
         selection = sqlalchemy.select(columns, where, from_obj=[self.schema])
 
         if order_by is not None:
@@ -297,27 +541,96 @@ class Table(object):
             elif hasattr(order_by, '__call__'):
                 order_by = order_by(self.t.c)
 
-            selection = selection.order_by(order_by)
+            if isinstance(order_by, (list, tuple)):
+                selection = selection.order_by(*order_by)
+            else:
+                selection = selection.order_by(order_by)
+
+        if params.pop('distinct', False):
+            selection = selection.distinct()
 
         if limit:
             selection = selection.limit(limit)
 
+        # page rows by db, instead of fetching all rows then slicing them.
+        start = params.pop('start', 0)
+        length = params.pop('length', 0)
+        if length > 0:
+            selection = selection.limit(length)
+            if start > 0:
+                selection = selection.offset(start)
+
+        # lock='skip_locked' skips rows locked by others if db supports it,
+        # else falls back to a normal lock.
         lock = params.pop('lock', None)
-        if lock:
+        if lock == 'skip_locked' and self.database.skip_locked:
+            selection = selection.suffix_with('FOR UPDATE SKIP LOCKED')
+        elif lock:
             selection = selection.with_for_update()
 
         rows = self.execute(selection, **params)
 
         return rows
 
+    def iter_select(self, where=None, fields=None, batch_size=1000,
+                    **params):
+        """
+        yield rows one by one in primary key order.
+
+        rows are selected in batches after the last primary key of previous
+        batch, so memory stays flat no matter how many rows are selected,
+        and no connection is held between batches.
+        """
+        if where is not None:
+            where = self.make_where(where)
+
+        if fields and self.primary not in fields:
+            fields = list(fields) + [self.primary]
+
+        column = self.schema.c[self.primary]
+        last = None
+        while True:
+            batch_where = where
+            if last is not None:
+                if where is not None:
+                    batch_where = and_(where, column > last)
+                else:
+                    batch_where = column > last
+
+            rows = self._select(batch_where, fields, limit=batch_size,
+                                order_by=column.asc(), **params)
+            for row in rows:
+                yield row
+
+            if len(rows) < batch_size:
+                break
+            last = rows[-1][self.primary]
+
     def get(self, primary, fields=None, as_dictionary=True, **params):
-        where = self.make_primary_where(primary)
-        rows = self._select(where, fields, as_dictionary=as_dictionary, **params)  # noqa
+        if params.get('lock'):
+            where = self.make_primary_where(primary)
+            rows = self._select(where, fields, as_dictionary=as_dictionary, **params)  # noqa
+        else:
+            params.pop('lock', None)
+            rows = self.execute(self._get_statement(fields),
+                                as_dictionary=as_dictionary,
+                                params={'_primary': primary},
+                                **params)
         if rows:
             return rows[0]
         else:
             return None
 
+    def _get_statement(self, fields):
+        key = frozenset(fields) if fields else None
+        statement = self._get_statements.get(key)
+        if statement is None:
+            statement = sqlalchemy.select(self._get_columns(fields),
+                                          self._primary_where,
+                                          from_obj=[self.schema])
+            self._get_statements[key] = statement
+        return statement
+
     def first(self, where=None, fields=None, order_by=None, **params):
         items = self.select(where=where, fields=fields, limit=1,
                             order_by=order_by, **params)
@@ -337,15 +650,92 @@ class Table(object):
         else:
             return None
 
+    def bulk_insert(self, items, batch_size=500):
+        """
+        insert rows by executemany, batch_size rows a statement.
+        all rows must have the same keys. return the inserted row count.
+        """
+        items = [self.normalize_values(dict(item)) for item in items]
+        for item in items:
+            self._check_columns(item)
+
+        count = 0
+        for i in range(0, len(items), batch_size):
+            result = self.execute(self._insert_statement, raw=True,
+                                  params=items[i:i + batch_size])
+            count += result.rowcount
+        return count
+
+    def bulk_update(self, values_by_primary, batch_size=500, where=None):
+        """
+        update rows of {primary: values}.
+
+        rows with identical values are updated together by
+        UPDATE ... WHERE primary IN (...), batch_size rows a statement.
+        where: if set, only rows matching it as well are updated.
+        return the updated row count.
+        """
+        if where is not None:
+            where = self.make_where(where)
+
+        groups = {}
+        for primary, values in values_by_primary.items():
+            values = self.normalize_values(dict(values))
+            key = tuple(sorted(values.items()))
+            groups.setdefault(key, []).append(primary)
+
+        column = self.schema.c[self.primary]
+        count = 0
+        for key, primaries in groups.items():
+            for i in range(0, len(primaries), batch_size):
+                batch = column.in_(primaries[i:i + batch_size])
+                if where is not None:
+                    batch = and_(batch, where)
+                count += self.update_any(batch, dict(key))
+        return count
+
+    def move_to(self, to, where=None, limit=1000, lock='skip_locked'):
+        """
+        move at most limit rows into table `to`, by
+            INSERT INTO to SELECT ... WHERE primary IN (...)
+            DELETE FROM this WHERE primary IN (...)
+        columns missing in `to` are dropped. run it in a transaction, or a
+        crash between the two statements copies rows without deleting them.
+
+        return the moved primary keys.
+        """
+        if where is not None:
+            where = self.make_where(where)
+
+        column = self.schema.c[self.primary]
+        rows = self._select(where, [self.primary], limit=limit,
+                            order_by=column.asc(), lock=lock)
+        primaries = [row[self.primary] for row in rows]
+        if not primaries:
+            return []
+
+        names = [c.name for c in self.schema.c if c.name in to.fields]
+        selection = sqlalchemy.select([self.schema.c[n] for n in names],
+                                      column.in_(primaries))
+        self.execute(to.schema.insert().from_select(names, selection),
+                     raw=True)
+        self.delete_any(column.in_(primaries))
+        return primaries
+
     def insert(self, values={}, **kwargs):
         """
         insert one row. return the id.
         """
         values = values.copy()
         values.update(kwargs)
+        self._check_columns(values)
 
-        sql = self.schema.insert(values)
-        result = self.execute(sql, raw=True)
+        if self._has_expressions(values):
+            sql = self.schema.insert().values(values)
+            result = self.execute(sql, raw=True)
+        else:
+            result = self.execute(self._insert_statement, raw=True,
+                                  params=values)
 
         if getattr(result, 'inserted_primary_key', None):
             return result.inserted_primary_key[0]
@@ -370,11 +760,37 @@ class Table(object):
         values = values.copy()
         values.update(kwargs)
         values = self.normalize_values(values)
-        where = self.make_primary_where(primary)
-        sql = self.schema.update(where).values(values)
-        ret = self.execute(sql, raw=True)
+        self._check_columns(values)
+        if not values:
+            raise sqlalchemy.exc.CompileError('no column to update')
+
+        if self._has_expressions(values):
+            where = self.make_primary_where(primary)
+            sql = self.schema.update(where).values(values)
+            ret = self.execute(sql, raw=True)
+        else:
+            values['_primary'] = primary
+            ret = self.execute(self._update_statement, raw=True,
+                               params=values)
         return ret.rowcount
 
+    def update_if(self, primary, expected, values={}, **kwargs):
+        """
+        compare and set. update the row only if its columns are equal to
+        expected ({column: value}, or {column: [values]} for any of them).
+
+        return True if the row is updated.
+        """
+        where = self.make_primary_where(primary)
+        for name, value in expected.items():
+            column = self.schema.c[name]
+            if isinstance(value, (list, tuple, set)):
+                where = and_(where, column.in_(value))
+            else:
+                where = and_(where, column == value)
+
+        return self.update_any(where, values, **kwargs) > 0
+
     def update_any(self, where, values={}, **kwargs):
         values = values.copy()
         values.update(kwargs)
@@ -443,3 +859,67 @@ class Table(object):
         else:
             return dict(items=[], current_page=1, last_page=1,
                         size=size, total=count)
+
+    # extension
+    def keyset_pagination(self, where=None, after=None, limit=10,
+                          keys=('created', 'id'), reverse=True, **params):
+        """
+        cursor based pagination. a page starts after the keys of the last
+        row of previous page instead of an offset, so LIMIT is done by db
+        and a deep page costs the same as the first one.
+
+        after: `next` cursor of the previous page, None for the first page.
+        keys: columns to order by, the last one must be unique.
+
+        return dict(items, limit, next), next is None on the last page.
+        """
+        if where is not None:
+            where = self.make_where(where)
+
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != len(keys):
+                raise ValueError('invalid cursor %s' % after)
+
+            after_where = self._after_where(keys, values, reverse)
+            if where is not None:
+                where = and_(where, after_where)
+            else:
+                where = after_where
+
+        fields = params.pop('fields', None)
+        if fields:
+            fields = list(fields) + [k for k in keys if k not in fields]
+
+        if reverse:
+            order_by = [self.schema.c[k].desc() for k in keys]
+        else:
+            order_by = [self.schema.c[k].asc() for k in keys]
+
+        items = self._select(where, fields, limit=limit + 1,
+                             order_by=order_by, **params)
+
+        next = None
+        if len(items) > limit:
+            items = items[:limit]
+            next = encode_cursor([items[-1][k] for k in keys])
+
+        return dict(items=items, limit=limit, next=next)
+
+    def _after_where(self, keys, values, reverse):
+        """
+        rows after values in keys order, e.g. keys (a, b) ascending:
+            a > va OR (a = va AND b > vb)
+        """
+        where = None
+        for i in reversed(range(len(keys))):
+            column = self.schema.c[keys[i]]
+            if reverse:
+                clause = column < values[i]
+            else:
+                clause = column > values[i]
+
+            if where is not None:
+                clause = or_(clause, and_(column == values[i], where))
+            where = clause
+        return where
@@ -28,6 +28,10 @@ def start_context(tail=None):
     _put_local('context_id', context_id)
 
 
+def set_context_id(context_id):
+    _put_local('context_id', context_id)
+
+
 def get_context_id():
     return _get_local('context_id') or ""
 
@@ -58,3 +62,23 @@ def enter_lock_context():
 
 def exit_lock_context():
     _del_local('lock_context')
+
+
+def set_soft_deadline(deadline):
+    _put_local('soft_deadline', deadline)
+
+
+def get_soft_deadline():
+    return _get_local('soft_deadline')
+
+
+def add_trans_callback(callback):
+    callbacks = _get_local('trans_callbacks') or []
+    callbacks.append(callback)
+    _put_local('trans_callbacks', callbacks)
+
+
+def pop_trans_callbacks():
+    callbacks = _get_local('trans_callbacks') or []
+    _del_local('trans_callbacks')
+    return callbacks
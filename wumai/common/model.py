@@ -113,6 +113,22 @@ class Model(object):
 
     select = list
 
+    @classmethod
+    def iter(cls, where=None, fields=None, batch_size=1000):
+        """
+        like list, but yield items lazily in batches, for a huge selection.
+        """
+        if cls.deletable:
+            return cls.db().iter_select(where, fields, batch_size=batch_size)
+        else:
+            return cls.db().iter_select(cls._where_with_deleted(where, 0),
+                                        fields, batch_size=batch_size)
+
+    @classmethod
+    def iter_as_model(cls, where=None, fields=None, batch_size=1000):
+        for item in cls.iter(where, fields, batch_size):
+            yield cls(**item)
+
     @classmethod
     def get(cls, id, include_deleted=False, lock=None):
         item = cls.db().get(id, lock=lock)
@@ -141,10 +157,21 @@ class Model(object):
 
     @classmethod
     def update(cls, id, **kwargs):
+        """
+        return the matched row count, 0 if the row does not exist.
+        """
+        return cls.db().update(id, **kwargs)
+
+    @classmethod
+    def update_if(cls, id, expected, **kwargs):
+        """
+        update the row only if its columns are equal to expected,
+        without reading it first. return True if the row is updated.
+        """
         if not cls.deletable:
-            cls.get(id)
+            expected = dict(expected, deleted=0)
 
-        cls.db().update(id, **kwargs)
+        return cls.db().update_if(id, expected, **kwargs)
 
     @classmethod
     def delete_any(cls, where):
@@ -167,6 +194,21 @@ class Model(object):
 
         return cls.db().insert(**kwargs)
 
+    @classmethod
+    def bulk_insert(cls, rows, batch_size=500):
+        if not cls.deletable:
+            rows = [dict(row, deleted=row.get('deleted', 0)) for row in rows]
+
+        return cls.db().bulk_insert(rows, batch_size=batch_size)
+
+    @classmethod
+    def bulk_update(cls, values_by_id, batch_size=500):
+        if cls.deletable:
+            return cls.db().bulk_update(values_by_id, batch_size=batch_size)
+        else:
+            return cls.db().bulk_update(values_by_id, batch_size=batch_size,
+                                        where=lambda t: t.deleted == 0)
+
     @classmethod
     def deleted(cls):
         if cls.deletable:
@@ -207,3 +249,22 @@ class Model(object):
         page = cls.pagination(where, fields, order_by, current_page, size)
         page['items'] = [cls(**item) for item in page['items']]
         return page
+
+    @classmethod
+    def keyset_pagination(cls, where=None, fields=None, after=None, limit=10,
+                          keys=('created', 'id'), reverse=True):
+        if not cls.deletable:
+            where = cls._where_with_deleted(where, 0)
+
+        return cls.db().keyset_pagination(where, after=after, limit=limit,
+                                          keys=keys, reverse=reverse,
+                                          fields=fields)
+
+    @classmethod
+    def keyset_pagination_as_model(cls, where=None, fields=None, after=None,
+                                   limit=10, keys=('created', 'id'),
+                                   reverse=True):
+        page = cls.keyset_pagination(where, fields, after, limit,
+                                     keys, reverse)
+        page['items'] = [cls(**item) for item in page['items']]
+        return page
@@ -0,0 +1,97 @@
+"""
+Wakeup channels, used to tell sleeping listeners that something happened.
+
+A channel only carries a hint, never the data itself. listeners should
+go and check the real source (e.g. the db) after being woken up, and should
+not rely on receiving every message.
+
+two channels are shipped:
+
+    RedisChannel:  redis pub/sub, works across hosts.
+    SocketChannel: unix datagram sockets in a shared directory,
+                   a local stand-in when redis is not available.
+"""
+import os
+import glob
+import errno
+import socket
+
+
+class RedisChannel(object):
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def publish(self, message=''):
+        self.connection.publish(self.name, message)
+
+    def listen(self, callback):
+        """
+        block forever, call callback(message) every time a message arrives.
+        """
+        pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.name)
+        try:
+            for message in pubsub.listen():
+                callback(message['data'])
+        finally:
+            pubsub.close()
+
+
+class SocketChannel(object):
+    """
+    every listener binds its own socket in directory,
+    publisher sends the message to every socket found there.
+    """
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+
+    def _socket_path(self):
+        return os.path.join(self.directory,
+                            '%s.%d.sock' % (self.name, os.getpid()))
+
+    def publish(self, message=''):
+        pattern = os.path.join(self.directory, '%s.*.sock' % self.name)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        try:
+            for path in glob.glob(pattern):
+                try:
+                    sock.sendto(message, path)
+                except socket.error as ex:
+                    # the listener is gone, remove its socket file.
+                    if ex.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    # EAGAIN: listener's buffer is full, it has enough
+                    # wakeups to handle already.
+        finally:
+            sock.close()
+
+    def listen(self, callback):
+        """
+        block forever, call callback(message) every time a message arrives.
+        """
+        if not os.path.exists(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                pass
+
+        path = self._socket_path()
+        if os.path.exists(path):
+            os.remove(path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        try:
+            while True:
+                message = sock.recv(1024)
+                callback(message)
+        finally:
+            sock.close()
+            os.remove(path)
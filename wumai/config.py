@@ -21,10 +21,18 @@ class config(object):
         self.db_user = os.getenv('DB_USER')
         self.db_password = os.getenv('DB_PASSWORD')
         self.db_database = os.getenv('DB_DATABASE')
+        self.db_lazy_reflect = os.getenv('DB_LAZY_REFLECT') == 'True'
+        self.db_meta_cache_dir = os.getenv('DB_META_CACHE_DIR')
 
         self.redis_host = os.getenv('REDIS_HOST')
         self.redis_port = int(os.getenv('REDIS_PORT') or 6379)
 
+        # job params and results larger than blob_threshold bytes are
+        # stored in blob_dir, or blob_table of db, see wumai.blob.
+        self.blob_dir = os.getenv('BLOB_DIR')
+        self.blob_table = os.getenv('BLOB_TABLE')
+        self.blob_threshold = int(os.getenv('BLOB_THRESHOLD') or 4096)
+
     def apply(self, **kwargs):
         for k, v in kwargs.items():
             setattr(self, k, v)
@@ -7,7 +7,9 @@ DB = None
 def setup():
     global DB
 
-    DB = db.Database(get_connection())
+    DB = db.Database(get_connection(),
+                     lazy=config.CONF.db_lazy_reflect,
+                     cache_dir=config.CONF.db_meta_cache_dir)
     DB.echo_on(config.CONF.debug)
 
 
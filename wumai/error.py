@@ -184,6 +184,19 @@ class JobNotFound(BaseJobException):
         self.message = 'Job (%s) is not found' % job_id
 
 
+class JobSoftTimeout(BaseJobException):
+    """
+    raised by an action stopping at its soft deadline (job.soft_deadline()),
+    some time before the try times out. time_sleep of actions with the
+    soft_timeout option raises it at the soft deadline.
+    """
+    def __init__(self, message=None):
+        if message is None:
+            message = 'Job reaches its soft deadline.'
+
+        self.message = message
+
+
 ##################################################################
 #
 #  Server Side Error ==> DB Error Family
@@ -130,7 +130,11 @@ def open_transaction(database):
     else:
         logger.info('transaction commit.')
         session.commit()
+
+        for callback in local.pop_trans_callbacks():
+            callback()
     finally:
+        local.pop_trans_callbacks()
         local.exit_trans_context()
 
         logger.info('transaction session remove.')
@@ -151,3 +155,44 @@ def transaction(method):
             return method(*args, **kwargs)
 
     return wrap
+
+
+def after_commit(callback):
+    """
+    call callback after current transaction is committed,
+    discard it if the transaction rollback.
+
+    if not in transaction context, call it right now.
+    """
+    if local.in_trans_context():
+        local.add_trans_callback(callback)
+    else:
+        callback()
+
+
+def archive(table, to, where, batch_size=1000, pause=0):
+    """
+    move rows of table matching where into table `to`, batch_size rows a
+    transaction, so rows are locked for a short time only and the
+    transaction log stays small. sleep pause seconds between batches to
+    give way to other writers.
+
+    called in a transaction, the batches join it and are committed or
+    rolled back with it.
+
+    return the count of moved rows.
+    """
+    count = 0
+    while True:
+        moved = _move_batch(table, to, where, batch_size)
+        count += len(moved)
+
+        if len(moved) < batch_size:
+            return count
+        if pause:
+            time.sleep(pause)
+
+
+@transaction
+def _move_batch(table, to, where, limit):
+    return table.move_to(to, where, limit=limit)
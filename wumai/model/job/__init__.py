@@ -1,10 +1,8 @@
 import functools
 
-from wumai.model import base
 from wumai.model.job import job as job_model
 from wumai.common import local
 from wumai.common import utils
-from wumai import db
 
 from wumai import logger
 logger = logger.getChild(__file__)
@@ -13,7 +11,10 @@ logger = logger.getChild(__file__)
 def job_id_context(method):
     @functools.wraps(method)
     def wrap(job_id, *args, **kwargs):
-        local.start_context(job_id[-4:])
+        if isinstance(job_id, basestring):
+            local.start_context(job_id[-4:])
+        else:
+            local.start_context(job_id['id'][-4:])
         try:
             return method(job_id, *args, **kwargs)
         finally:
@@ -24,17 +25,28 @@ def job_id_context(method):
 @job_id_context
 @utils.footprint(logger)
 def run_job(job_id, worker):
-    with base.open_transaction(db.DB):
-        job = job_model.fetch(job_id)
-
-        if not job or not job.status_executable():
-            status = job['status'] if job else 'db locked'
-            logger.info('not executable right now, status: (%s).' % status)
-            return
+    """
+    take the job by a compare and set from pending to running,
+    the worker whose update matches the row owns it. no row lock is held.
+    """
+    lease_expires = utils.seconds_later(worker.lease)
+    if not job_model.update_if(job_id, job_model.JOB_STATUS_PENDING,
+                               status=job_model.JOB_STATUS_RUNNING,
+                               owner=worker.worker_id,
+                               lease_expires=lease_expires):
+        logger.info('not executable right now, taken by others.')
+        return
+
+    job = job_model.get(job_id)
+    job_model.execute(job, worker=worker)
 
-        job_model.prepare(job)
 
-    job = job_model.fetch(job_id)
+@job_id_context
+@utils.footprint(logger)
+def execute_job(job, worker):
+    """
+    execute a job which is already claimed by job_model.claim
+    """
     job_model.execute(job, worker=worker)
 
 
@@ -42,14 +54,8 @@ def run_job(job_id, worker):
 @utils.footprint(logger)
 def clean_job(job_id):
     """
-    fetch a job lock. update the job status to pending
+    update a running job to pending, releasing its lease.
     """
-    with base.open_transaction(db.DB):
-        job = job_model.fetch(job_id)
-
-        if not job or not job.status_resetable():
-            status = job['status'] if job else 'db locked'
-            logger.info('not clean right now, status: (%s).' % status)
-            return
-
-        job_model.reset(job)
+    job = job_model.get(job_id)
+    if not job_model.reset(job):
+        logger.info('not clean right now, status: (%s).' % job['status'])
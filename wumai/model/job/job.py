@@ -1,18 +1,21 @@
 import sys
-import time
 import datetime
 import json
 import traceback
-import gevent
 from gevent import Timeout
 from wumai import db
+from wumai import blob
+from wumai import wakeup
 from wumai.common import utils
+from wumai.common import local
 from wumai.model import base
 from wumai.model import filters
+from wumai.model.job import retry
 
 from wumai import error
 
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import and_, or_, exists
+from sqlalchemy.exc import IntegrityError
 
 from wumai import logger
 logger = logger.getChild(__file__)
@@ -23,6 +26,17 @@ JOB_STATUS_PENDING = 'pending'
 JOB_STATUS_RUNNING = 'running'
 JOB_STATUS_FINISHED = 'finished'
 JOB_STATUS_ERROR = 'error'
+# waiting for jobs it depends on, never picked by workers.
+JOB_STATUS_WAITING = 'waiting'
+
+# jobs not settled yet, a dedupe_key is held by one of them at most.
+JOB_ACTIVE_STATUSES = [JOB_STATUS_WAITING, JOB_STATUS_PENDING,
+                       JOB_STATUS_RUNNING]
+
+# smaller priority runs first.
+JOB_PRIORITY_HIGH = -10
+JOB_PRIORITY_NORMAL = 0
+JOB_PRIORITY_LOW = 10
 
 NOTIFY_JOB_STARTED = 'notify_job_started'
 NOTIFY_JOB_FAILED = 'notify_job_failed'
@@ -35,10 +49,18 @@ class Job(base.StatusModel):
     def db(cls):
         return db.DB.job
 
+    def get_params(self):
+        return json.loads(blob.unpack(self['params']))
+
+    def get_result(self):
+        result = blob.unpack(self['result'])
+        return json.loads(result) if result else None
+
     def get_resources(self):
         try:
-            return json.loads(self['params'])['resource_ids']
-        except:
+            return self.get_params()['resource_ids']
+        except (KeyError, TypeError, ValueError):
+            # errors of the blob store are raised, not shown as no resources.
             return []
 
     def status_executable(self):
@@ -83,73 +105,268 @@ def get_resources(job_id):
 
 
 @utils.footprint(logger)
-def fetch(job_id):
+def reset(job):
     """
-    fetch a locked job. if the job is locked by other workers
-    return None
+    put a running job back to pending and release its lease, by a compare
+    and set from running. return True if it is reset.
+    """
+    return update_if(job['id'], JOB_STATUS_RUNNING,
+                     status=JOB_STATUS_PENDING,
+                     owner=None,
+                     lease_expires=None)
+
 
-    we wait at most timeout seconds to get the job from db.
-    if not, return None
+@utils.footprint(logger)
+def claim(limit, owner, lease=60, quotas=None):
     """
-    try:
-        with base.lock_for_update():
-            job = get(job_id)
+    move at most limit due pending jobs to running in one transaction,
+    leased to owner for lease seconds, return them.
 
-    except error.DBLockTimeoutError:
-        # normally we will not come here, because gevent Timeout is
-        # much shorter than db lock timeout.
-        stack = traceback.format_exc()
-        logger.trace(stack)
+    jobs are claimed by priority first, then by run_at.
+
+    quotas: {action: n}, claim at most n jobs of action,
+            actions not in quotas are not limited.
+
+    rows locked by other workers are skipped if the db supports
+    SKIP LOCKED, else we wait for their lock.
+    """
+    if limit <= 0:
+        return []
+
+    now = datetime.datetime.utcnow()
+    lease_expires = now + datetime.timedelta(seconds=lease)
+
+    quotas = dict(quotas or {})
+    full_actions = [action for action, n in quotas.items() if n <= 0]
+
+    # only ids (in the index) and actions, not large params and results.
+    fields = ['id', 'action'] if quotas else ['id']
+
+    with base.open_transaction(db.DB):
+        items = Job.db().select(_due_where(now, exclude=full_actions),
+                                fields=fields,
+                                limit=limit,
+                                order_by=_due_order,
+                                lock='skip_locked')
+
+        # the rest are left pending, their lock is released on commit.
+        if quotas:
+            items = _within_quotas(items, quotas)
+        if not items:
+            return []
+
+        job_ids = [item['id'] for item in items]
+
+        def claimable(t):
+            return and_(t.id.in_(job_ids), t.status == JOB_STATUS_PENDING)
+
+        claimed = Job.update_any(claimable,
+                                 status=JOB_STATUS_RUNNING,
+                                 owner=owner,
+                                 lease_expires=lease_expires,
+                                 updated=now)
+        if claimed != len(job_ids):
+            # rows are not locked by this db (e.g. sqlite), and someone
+            # else claimed some of them. give up this batch.
+            logger.info('claim conflicts, %d of %d jobs are claimed.' %
+                        (claimed, len(job_ids)))
+            db.DB.session.rollback()
+            return []
+
+        # fields for execution, in claimed order.
+        rows = Job.db().select(lambda t: t.id.in_(job_ids),
+                               fields=_execute_fields())
+        rows.sort(key=lambda row: job_ids.index(row['id']))
+
+    return [Job(**row) for row in rows]
+
+
+def _execute_fields():
+    return [field for field in Job.db().fields
+            if field not in ('error', 'result')]
 
-        # if get lock failed, means other worker is locking the job.
-        logger.error('fetch job is locked by other workers, skip it.')
-        return None
-    else:
-        return job
+
+def _within_quotas(items, quotas):
+    within = []
+    for item in items:
+        action = item['action']
+        if action in quotas:
+            if quotas[action] <= 0:
+                continue
+            quotas[action] -= 1
+        within.append(item)
+    return within
 
 
 @utils.footprint(logger)
-def prepare(job):
-    update(job['id'], status=JOB_STATUS_RUNNING)
+def renew_leases(owner, job_ids, lease=60):
+    """
+    heartbeat, extend leases of running jobs of job_ids owned by owner.
+
+    job_ids are jobs the owner is executing now, a job left running by
+    a broken execution is not renewed, and is reaped when it expires.
+    return count of renewed jobs.
+    """
+    if not job_ids:
+        return 0
+
+    lease_expires = utils.seconds_later(lease)
+
+    def where(t):
+        return and_(t.id.in_(job_ids),
+                    t.owner == owner,
+                    t.status == JOB_STATUS_RUNNING)
+
+    return Job.update_any(where, lease_expires=lease_expires)
 
 
 @utils.footprint(logger)
-def reset(job):
-    update(job['id'], status=JOB_STATUS_PENDING)
+def release_leases(owner):
+    """
+    put running jobs owned by owner back to pending, without counting
+    a try. used by a stopping worker for jobs it could not finish.
+    """
+    def where(t):
+        return and_(t.owner == owner, t.status == JOB_STATUS_RUNNING)
+
+    released = Job.update_any(where,
+                              status=JOB_STATUS_PENDING,
+                              owner=None,
+                              lease_expires=None,
+                              updated=datetime.datetime.utcnow())
+    if released:
+        base.after_commit(wakeup.publish)
+    return released
+
+
+@utils.footprint(logger)
+def reap_expired():
+    """
+    reset running jobs whose lease expired to pending,
+    their owner is dead or lost its db connection.
+
+    jobs set running without a lease (e.g. by old workers)
+    are treated as expired.
+    """
+    now = datetime.datetime.utcnow()
+
+    def where(t):
+        return and_(t.status == JOB_STATUS_RUNNING,
+                    or_(t.lease_expires < now, t.lease_expires == None))  # noqa
+
+    reaped = Job.update_any(where,
+                            status=JOB_STATUS_PENDING,
+                            owner=None,
+                            lease_expires=None,
+                            updated=now)
+    if reaped:
+        logger.info('reaped %d jobs with expired lease.' % reaped)
+        base.after_commit(wakeup.publish)
+    return reaped
+
+
+@utils.footprint(logger)
+def archive(days=30, batch_size=1000, pause=0):
+    """
+    move finished and error jobs not updated for days into job_archive,
+    see wumai.model.base.archive. return the count of moved jobs.
+    """
+    before = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+    def where(t):
+        return and_(t.status.in_([JOB_STATUS_FINISHED, JOB_STATUS_ERROR]),
+                    t.updated < before)
+
+    archived = base.archive(Job.db(), db.DB.job_archive, where,
+                            batch_size=batch_size, pause=pause)
+    if archived:
+        logger.info('archived %d jobs.' % archived)
+    return archived
 
 
 @utils.footprint(logger)
 def execute(job, worker):
-    timeout = worker.exec_timeout
+    """
+    execute a try of a claimed job, and save its end.
+
+    an exception out of the action's failure handling (e.g. broken params,
+    an unknown retry policy, db errors) fails the job, or if even that
+    can not be saved, leaves it running to be reaped when its lease expires.
+    """
+    try:
+        _execute(job, worker)
+    except (Exception, Timeout) as ex:
+        stack = traceback.format_exc()
+        logger.trace(stack)
+        logger.error('execution of job broken, confirmed failed.')
+
+        try:
+            worker.notify(NOTIFY_JOB_FAILED, job,
+                          exc_info=sys.exc_info(),
+                          has_tried=job['trys'] + 1,
+                          is_last_chance=True)
+        except Exception:
+            stack = traceback.format_exc()
+            logger.trace(stack)
+
+        try:
+            _settle(job, worker,
+                    status=JOB_STATUS_ERROR,
+                    trys=job['trys'] + 1,
+                    error=str(ex))
+        except Exception:
+            stack = traceback.format_exc()
+            logger.trace(stack)
 
-    action = job['action']
-    action_func = getattr(worker.action_module, utils.snake_case(action))
 
-    params = json.loads(job['params'])
+def _execute(job, worker):
+    action = job['action']
+    action_func = worker.actions.get(action)
+    if action_func is None:
+        logger.error('action %s is not defined, confirmed failed.' % action)
+        _settle(job, worker,
+                status=JOB_STATUS_ERROR,
+                error='action %s is not defined' % action)
+        return
+
+    timeout = job['timeout'] or action_func.timeout or worker.exec_timeout
+    soft_timeout = timeout - min(worker.exec_grace, timeout / 2.0)
+
+    params = job.get_params()
     params_safe = utils.hide_secret(params)
 
     logger.info('action: %s, params: %s' % (action, params_safe))
 
-    if worker.gevent:
-        time_sleep = gevent.sleep
-    else:
-        time_sleep = time.sleep
+    deadline = utils.seconds_later(soft_timeout)
+
+    time_sleep = worker.executor.sleep
+    if action_func.soft_timeout:
+        time_sleep = _soft_sleep(time_sleep, deadline)
 
-    t = Timeout(timeout)
-    t.start()
     worker.notify(NOTIFY_JOB_STARTED, job)
 
+    has_tried = job['trys'] + 1
+    is_last_chance = (has_tried >= job['try_max'])
+
+    def try_action():
+        # set where the action runs, which is another thread with
+        # ThreadExecutor.
+        local.set_soft_deadline(deadline)
+        return action_func(params,
+                           time_sleep=time_sleep,
+                           is_last_chance=is_last_chance)
+
     try:
-        has_tried = job['trys'] + 1
-        is_last_chance = (has_tried >= job['try_max'])
-        result = action_func(params,
-                             time_sleep=time_sleep,
-                             is_last_chance=is_last_chance)
+        # the timeout covers the action only, never the saving below.
+        result = worker.executor.run(try_action, timeout)
     except (Exception, Timeout) as ex:  # Timeout inherits from BaseException
         if isinstance(ex, Timeout):
             # this execution exceed 10 minutes, timeout.
             logger.error('exec_job timeout, didn\'t finish in %d seconds.' %
                          timeout)
+        elif isinstance(ex, error.JobSoftTimeout):
+            logger.error('exec_job reached soft deadline, in %d seconds.' %
+                         soft_timeout)
 
         if isinstance(ex, error.IaasProviderActionError):
             stack = str(ex)
@@ -160,30 +377,36 @@ def execute(job, worker):
 
         logger.trace(stack)
 
+        policy = retry.get(job['retry_policy'] or action_func.retry_policy)
+        retryable = policy.retryable(ex)
+
         worker.notify(NOTIFY_JOB_FAILED, job,
                       exc_info=sys.exc_info(),
                       has_tried=has_tried,
-                      is_last_chance=is_last_chance)
+                      is_last_chance=is_last_chance or not retryable)
 
         logger.error('%s job, this try(%d) failed' % (action, has_tried))
 
-        next_seconds = job['try_period'] * has_tried
-        next_run_at = utils.seconds_later(next_seconds)
-
-        if is_last_chance:
+        if is_last_chance or not retryable:
             # the job is failed indeed.
-            update(job['id'],
-                   status=JOB_STATUS_ERROR,
-                   trys=has_tried,
-                   params=json.dumps(params_safe),
-                   error=str(ex))
-            logger.error('reach max tries, confirmed failed.')
+            _settle(job, worker,
+                    status=JOB_STATUS_ERROR,
+                    trys=has_tried,
+                    params=blob.pack(json.dumps(params_safe)),
+                    error=str(ex))
+            if retryable:
+                logger.error('reach max tries, confirmed failed.')
+            else:
+                logger.error('not retryable, confirmed failed.')
         else:
+            next_seconds = policy.delay(job, has_tried)
+            next_run_at = utils.seconds_later(next_seconds)
+
             # reschedule the job
-            update(job['id'],
-                   status=JOB_STATUS_PENDING,
-                   trys=has_tried,
-                   run_at=next_run_at)
+            _settle(job, worker,
+                    status=JOB_STATUS_PENDING,
+                    trys=has_tried,
+                    run_at=next_run_at)
             logger.info(('scheduled for next try at %s '
                          '(in %d secons)') %
                         (next_run_at, next_seconds))
@@ -193,15 +416,59 @@ def execute(job, worker):
 
         # use may modify params (maybe params contains secret infomation?),
         # we save params back to db.
-        update(job['id'],
-               status=JOB_STATUS_FINISHED,
-               trys=has_tried,
-               error="",
-               params=json.dumps(params_safe),
-               result=json.dumps(result))
+        _settle(job, worker,
+                status=JOB_STATUS_FINISHED,
+                trys=has_tried,
+                error="",
+                params=blob.pack(json.dumps(params_safe)),
+                result=blob.pack(json.dumps(result)))
+
 
-    finally:
-        t.cancel()
+def _soft_sleep(sleep, deadline):
+    """
+    time_sleep of actions with the soft_timeout option, it raises
+    error.JobSoftTimeout at the soft deadline instead of sleeping past it.
+    """
+    def time_sleep(seconds):
+        remaining = (deadline - datetime.datetime.utcnow()).total_seconds()
+        if seconds < remaining:
+            sleep(seconds)
+            return
+        sleep(max(remaining, 0))
+        raise error.JobSoftTimeout()
+    return time_sleep
+
+
+def soft_deadline():
+    """
+    utc datetime of the soft deadline of the running job, None if not in
+    a job. actions polling for something may check it to stop in time.
+    """
+    return local.get_soft_deadline()
+
+
+def _settle(job, worker, **values):
+    """
+    save the end of an execution, only if the job is still leased to us.
+    if the lease expired and the job was reaped, the save is dropped,
+    the job's new owner decides its status.
+    """
+    values.update(lease_expires=None)
+    if values['status'] in [JOB_STATUS_FINISHED, JOB_STATUS_ERROR]:
+        # the next create() with the key makes a new job.
+        values.update(dedupe_key=None)
+    if not update_if(job['id'], JOB_STATUS_RUNNING,
+                     expected_owner=job['owner'], **values):
+        logger.error('lease of job is lost, execution result is dropped.')
+        return
+
+    if values['status'] in [JOB_STATUS_FINISHED, JOB_STATUS_ERROR]:
+        # failing here leaves dependents to resolve_waiting().
+        try:
+            _resolve(_dependents(job['id']), worker)
+        except Exception:
+            stack = traceback.format_exc()
+            logger.trace(stack)
 
 
 def create(action,
@@ -210,12 +477,19 @@ def create(action,
            status=JOB_STATUS_PENDING,
            run_at=None,
            try_period=600,
-           try_max=3):
+           try_max=3,
+           priority=JOB_PRIORITY_NORMAL,
+           retry_policy=None,
+           timeout=None,
+           depends_on=None,
+           dedupe_key=None,
+           coalesce=False):
     """
     action name is CamelCase.
     its snake_case is just identical to job/action.py function name.
     so if you create a new action,
-    make sure it have related function in action.py
+    make sure it have related function in action.py,
+    see job.registry.
 
     run_at:
         the job will be run at some datetime.
@@ -228,33 +502,410 @@ def create(action,
         if the job failed, how many times it can be rescheduled.
         default is 3 times.
 
+    priority:
+        due jobs of smaller priority run first,
+        JOB_PRIORITY_HIGH, JOB_PRIORITY_NORMAL(default), JOB_PRIORITY_LOW.
+
+    retry_policy:
+        name of a policy in job.retry, when to retry a failed try,
+        and which exceptions are not retried. default is 'linear',
+        which waits try_period * tried times.
+
+    timeout:
+        seconds, timeout of a try of this job, overrides the timeout
+        of the action and of the worker.
+
+    depends_on:
+        ids of jobs which must finish before this job runs. the job is
+        waiting till then, and fails if any of them fails.
+
+    dedupe_key:
+        at most 128 chars. if an active (waiting, pending or running) job
+        has the same key, no job is created, and its id is returned.
+        so clients retrying a create do not create duplicate jobs.
+
+    coalesce:
+        with dedupe_key, resource_ids of params are merged into the job of
+        the key if it has not started yet, and its id is returned. if it
+        is running, a new job takes over the key. so concurrent requests
+        of the same action run as one job for all their resources.
+
+    db rejects a duplicate key by the unique index, which aborts the
+    transaction on postgresql, create jobs with dedupe_key outside of a
+    transaction there.
+
     """
     logger.info('.create() start. action: %s, project_id: %s, params: %s' %
                 (action, project_id, params))
 
+    _check_retry_policy(retry_policy)
+
+    now = datetime.datetime.utcnow()
+    if run_at is None:
+        run_at = now
+
+    if dedupe_key is not None:
+        job_id = _deduplicate(dedupe_key, params, coalesce)
+        if job_id is not None:
+            logger.info('.create() OK. deduplicated by job: %s' % job_id)
+            return job_id
+
+    job = _new_job(action, project_id, params, status,
+                   run_at, try_period, try_max, priority,
+                   retry_policy, timeout, dedupe_key)
+    try:
+        if depends_on:
+            _insert_dependent([job], depends_on)
+        else:
+            Job.insert(**job)
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+
+        # a job of the key is created by others meanwhile.
+        job_id = _deduplicate(dedupe_key, params, coalesce)
+        if job_id is None:
+            raise
+        logger.info('.create() OK. deduplicated by job: %s' % job_id)
+        return job_id
+
+    # wake up workers when the job is visible to them,
+    # delayed jobs will be picked up by workers' polling.
+    if job['status'] == JOB_STATUS_PENDING and run_at <= now:
+        base.after_commit(wakeup.publish)
+
+    logger.info('.create() OK.')
+
+    return job['id']
+
+
+def create_many(action,
+                params_list,
+                project_id=SYSTEM_JOB,
+                status=JOB_STATUS_PENDING,
+                run_at=None,
+                try_period=600,
+                try_max=3,
+                priority=JOB_PRIORITY_NORMAL,
+                retry_policy=None,
+                timeout=None,
+                depends_on=None,
+                batch_size=500):
+    """
+    create one job of action for every params in params_list,
+    by batched inserts instead of one statement a job.
+
+    return created job ids, in the order of params_list.
+    other args are the same with create().
+    """
+    logger.info('.create_many() start. action: %s, project_id: %s, '
+                'count: %d' % (action, project_id, len(params_list)))
+
+    _check_retry_policy(retry_policy)
+
+    now = datetime.datetime.utcnow()
     if run_at is None:
-        run_at = datetime.datetime.utcnow()
+        run_at = now
+
+    jobs = [_new_job(action, project_id, params, status,
+                     run_at, try_period, try_max, priority, retry_policy,
+                     timeout)
+            for params in params_list]
+    if depends_on:
+        _insert_dependent(jobs, depends_on, batch_size=batch_size)
+    else:
+        Job.bulk_insert(jobs, batch_size=batch_size)
+
+    if jobs and jobs[0]['status'] == JOB_STATUS_PENDING and run_at <= now:
+        base.after_commit(wakeup.publish)
+
+    logger.info('.create_many() OK.')
+
+    return [job['id'] for job in jobs]
+
+
+@base.transaction
+def _insert_dependent(jobs, depends_on, batch_size=500):
+    """
+    insert jobs depending on jobs of depends_on.
+
+    the parents are locked till the jobs are committed, a parent settling
+    meanwhile waits, then finds the jobs by their dependencies. so no job
+    keeps waiting for a parent which already settled.
+    """
+    depends_on = sorted(set(depends_on))
+    parents = Job.db().select(lambda t: t.id.in_(depends_on),
+                              fields=['id', 'status'], lock=True)
+    statuses = dict((p['id'], p['status']) for p in parents)
+
+    missing = [i for i in depends_on if i not in statuses]
+    if missing:
+        raise error.InvalidRequestParameter(
+            'depends_on jobs not found: %s' % ', '.join(missing))
+
+    failed = [i for i in depends_on if statuses[i] == JOB_STATUS_ERROR]
+    unfinished = [i for i in depends_on
+                  if statuses[i] != JOB_STATUS_FINISHED]
+
+    for job in jobs:
+        if job['status'] != JOB_STATUS_PENDING:
+            continue
+        if failed:
+            job.update(status=JOB_STATUS_ERROR,
+                       error=_dependency_error(failed[0]))
+        elif unfinished:
+            job['status'] = JOB_STATUS_WAITING
+
+    Job.bulk_insert(jobs, batch_size=batch_size)
+
+    # only dependencies of waiting jobs on unfinished parents are kept.
+    dependencies = [{'job_id': job['id'], 'depends_on': parent}
+                    for job in jobs if job['status'] == JOB_STATUS_WAITING
+                    for parent in unfinished]
+    if dependencies:
+        db.DB.job_dependency.bulk_insert(dependencies,
+                                         batch_size=batch_size)
+
+
+def _dependency_error(parent_id):
+    return 'dependency %s failed' % parent_id
+
+
+def _dependents(job_id):
+    """
+    ids of jobs depending on job_id, none if there is no dependency table.
+    """
+    if not hasattr(db.DB, 'job_dependency'):
+        return []
+
+    rows = db.DB.job_dependency.select(lambda t: t.depends_on == job_id,
+                                       fields=['job_id'])
+    return [row['job_id'] for row in rows]
+
+
+def _resolve(job_ids, worker=None):
+    """
+    set waiting jobs whose parents all finished to pending, and those with
+    a failed (or missing) parent to error, then their dependents in turn.
+    dependencies of a resolved job are deleted, they are not needed any
+    more, so the dependency table holds waiting jobs only.
+
+    jobs failed by a parent are notified by worker as failed jobs.
+
+    return the count of resolved jobs.
+    """
+    table = db.DB.job_dependency
+    now = datetime.datetime.utcnow()
+
+    promoted = failed = 0
+    job_ids = list(job_ids)
+    while job_ids:
+        job_id = job_ids.pop()
+
+        rows = table.select(lambda t: t.job_id == job_id,
+                            fields=['depends_on'])
+        parent_ids = [row['depends_on'] for row in rows]
+        if parent_ids:
+            parents = Job.db().select(lambda t: t.id.in_(parent_ids),
+                                      fields=['id', 'status'])
+        else:
+            parents = []
+        statuses = dict((p['id'], p['status']) for p in parents)
+
+        bad = [i for i in parent_ids
+               if statuses.get(i, JOB_STATUS_ERROR) == JOB_STATUS_ERROR]
+        if bad:
+            values = dict(status=JOB_STATUS_ERROR,
+                          error=_dependency_error(bad[0]))
+        elif all(statuses[i] == JOB_STATUS_FINISHED for i in parent_ids):
+            values = dict(status=JOB_STATUS_PENDING)
+        else:
+            continue
+
+        # compare and set, the job may be resolved by others meanwhile.
+        if not Job.update_if(job_id, {'status': JOB_STATUS_WAITING},
+                             updated=now, **values):
+            continue
+        table.delete_any(lambda t: t.job_id == job_id)
+
+        if values['status'] == JOB_STATUS_PENDING:
+            promoted += 1
+        else:
+            failed += 1
+            job_ids.extend(_dependents(job_id))
+            if worker is not None:
+                _notify_dependency_failed(job_id, worker)
+
+    if promoted:
+        base.after_commit(wakeup.publish)
+    if promoted or failed:
+        logger.info('resolved waiting jobs, %d pending, %d failed.' %
+                    (promoted, failed))
+    return promoted + failed
+
+
+def _notify_dependency_failed(job_id, worker):
+    """
+    a job failed by its parent never tried, its failure is final.
+    """
+    try:
+        job = get(job_id)
+        worker.notify(NOTIFY_JOB_FAILED, job,
+                      exc_info=None,
+                      has_tried=job['trys'],
+                      is_last_chance=True)
+    except Exception:
+        stack = traceback.format_exc()
+        logger.trace(stack)
+
+
+@utils.footprint(logger)
+def resolve_waiting(limit=100, worker=None):
+    """
+    resolve waiting jobs whose parents all settled, but which were missed
+    when the parents settled, e.g. the worker died right after the settle.
+    return the count of resolved jobs.
+    """
+    if not hasattr(db.DB, 'job_dependency'):
+        return 0
+
+    dependency = db.DB.job_dependency.t
+    parent = Job.db().t.alias('parent')
+
+    def where(t):
+        unsettled = exists().where(and_(
+            dependency.c.job_id == t.id,
+            dependency.c.depends_on == parent.c.id,
+            ~parent.c.status.in_([JOB_STATUS_FINISHED, JOB_STATUS_ERROR])))
+        return and_(t.status == JOB_STATUS_WAITING, ~unsettled)
+
+    rows = Job.db().select(where, fields=['id'], limit=limit)
+    return _resolve((row['id'] for row in rows), worker)
+
+
+@base.transaction
+def _deduplicate(dedupe_key, params, coalesce):
+    """
+    return id of the job holding dedupe_key, which the new job is
+    deduplicated by. return None if a new job should be created, the key
+    is released if it is held by a settled job, or by a running job when
+    coalescing.
+    """
+    job = Job.db().first(lambda t: t.dedupe_key == dedupe_key,
+                         fields=['id', 'status', 'params'], lock=True)
+    if job is None:
+        return None
+
+    if coalesce and job['status'] in [JOB_STATUS_WAITING,
+                                      JOB_STATUS_PENDING]:
+        merged = json.loads(blob.unpack(job['params']))
+        resource_ids = merged.get('resource_ids') or []
+        added = [i for i in params.get('resource_ids') or []
+                 if i not in resource_ids]
+        if added:
+            merged['resource_ids'] = resource_ids + added
+            Job.update(job['id'],
+                       params=blob.pack(json.dumps(merged)),
+                       updated=datetime.datetime.utcnow())
+            logger.info('coalesced resources %s into job %s.' %
+                        (added, job['id']))
+        return job['id']
+
+    if not coalesce and job['status'] in JOB_ACTIVE_STATUSES:
+        return job['id']
+
+    Job.update(job['id'], dedupe_key=None)
+    return None
+
+
+def _check_retry_policy(name):
+    if name is not None and name not in retry.POLICIES:
+        raise error.InvalidRequestParameter(
+            'unknown retry policy: %s' % name)
+
 
-    job_id = Job.insert(**{
+def _new_job(action, project_id, params, status,
+             run_at, try_period, try_max, priority, retry_policy,
+             timeout, dedupe_key=None):
+    return {
         'id': 'job-' + utils.generate_key(10),
         'project_id': project_id,
         'action': action,
         'status': status,
         'error': '',
         'result': '',
-        'params': json.dumps(params),
+        'params': blob.pack(json.dumps(params)),
         'updated': datetime.datetime.utcnow(),
         'created': datetime.datetime.utcnow(),
         'run_at': run_at,
         'try_period': try_period,
         'try_max': try_max,
         'trys': 0,
+        'priority': priority,
+        'retry_policy': retry_policy,
+        'timeout': timeout,
+        'dedupe_key': dedupe_key,
+    }
 
-    })
 
-    logger.info('.create() OK.')
+DUE_KEYS = ('priority', 'run_at', 'id')
+
 
-    return job_id
+def _due_where(now, after=None, exclude=None):
+    """
+    pending jobs which should be running now.
+    after: (priority, run_at, id) of a job, only jobs after it in _due_order.
+    exclude: actions not wanted.
+    """
+    def where(t):
+        _where = and_(t.status == JOB_STATUS_PENDING, t.run_at <= now)
+        if after is not None:
+            _where = and_(_where,
+                          Job.db()._after_where(DUE_KEYS, after, False))
+        if exclude:
+            _where = and_(_where, ~t.action.in_(exclude))
+        return _where
+    return where
+
+
+def _due_order(t):
+    # matches index (status, priority, run_at, id), see schema.py
+    return [t.priority.asc(), t.run_at.asc(), t.id.asc()]
+
+
+def due(limit=10, after=None):
+    """
+    due pending jobs, by priority, then oldest run_at first.
+
+    unlike limitation(), it does not count the table, and walks pages by
+    keyset instead of offset, so the cost does not grow with table size.
+
+    after: (priority, run_at, id) of the last job returned by previous call,
+           to fetch the next jobs.
+    """
+    now = datetime.datetime.utcnow()
+    return Job.list_as_model(_due_where(now, after),
+                             limit=limit,
+                             order_by=_due_order)
+
+
+def pending_actions():
+    """
+    distinct actions of pending jobs.
+    """
+    def where(t):
+        return t.status == JOB_STATUS_PENDING
+
+    rows = Job.db().select(where, fields=['action'], distinct=True)
+    return [row['action'] for row in rows]
+
+
+def count_due():
+    """
+    count pending jobs which should be running now.
+    """
+    now = datetime.datetime.utcnow()
+    return Job.count(_due_where(now))
 
 
 def update(job_id, status=None,
@@ -262,24 +913,50 @@ def update(job_id, status=None,
            error=None, params=None, result=None):
     logger.info('.udpate() start. job_id: %s' % job_id)
 
+    updates = _updates(status=status, run_at=run_at, trys=trys,
+                       error=error, params=params, result=result)
+
+    # no read before update, only read to raise JobNotFound
+    # when nothing is matched.
+    if Job.update(job_id, **updates) == 0:
+        get(job_id)
+    logger.info('.udpate() OK.')
+
+
+def update_if(job_id, expected_status, expected_owner=None, **values):
+    """
+    compare and set a status transition, without reading the job first.
+
+    expected_status: a status or a list of statuses.
+    expected_owner: if set, the job must also be leased to this owner.
+    values: columns to update, None values are set to NULL.
+
+    return True if the job was expected and is updated,
+    False if it is not, raise JobNotFound if no such job.
+    """
+    logger.info('.update_if() start. job_id: %s, expected status: %s' %
+                (job_id, expected_status))
+
+    expected = {'status': expected_status}
+    if expected_owner is not None:
+        expected['owner'] = expected_owner
+
+    updates = dict(values, updated=datetime.datetime.utcnow())
+
+    if Job.update_if(job_id, expected, **updates):
+        logger.info('.update_if() OK.')
+        return True
+
+    # not updated, tell not found from unexpected status.
     get(job_id)
-    updates = {}
-    if status is not None:
-        updates['status'] = status
-    if run_at is not None:
-        updates['run_at'] = run_at
-    if trys is not None:
-        updates['trys'] = trys
-    if error is not None:
-        updates['error'] = error
-    if params is not None:
-        updates['params'] = params
-    if result is not None:
-        updates['result'] = result
+    logger.info('.update_if() skipped, job is not expected.')
+    return False
 
+
+def _updates(**kwargs):
+    updates = dict((k, v) for k, v in kwargs.items() if v is not None)
     updates['updated'] = datetime.datetime.utcnow()
-    Job.update(job_id, **updates)
-    logger.info('.udpate() OK.')
+    return updates
 
 
 def limitation(project_ids=None, status=None, run_at=None, job_ids=None,
@@ -306,3 +983,31 @@ def limitation(project_ids=None, status=None, run_at=None, job_ids=None,
                                    order_by=filters.order_by(reverse))
     logger.info('.limitation() OK.')
     return page
+
+
+def keyset_pagination(project_ids=None, status=None, job_ids=None,
+                      after=None, limit=10, reverse=True):
+    """
+    like limitation(), but pages by cursor instead of offset and total.
+
+    after: `next` of the previous page, None for the first page.
+    """
+    logger.info('.keyset_pagination() start.')
+
+    def where(t):
+        _where = True
+        _where = filters.filter_ids(_where, t, job_ids)
+        _where = filters.filter_project_ids(_where, t, project_ids)
+        _where = filters.filter_status(_where, t, status)
+        return _where
+
+    try:
+        page = Job.keyset_pagination_as_model(where,
+                                              after=after,
+                                              limit=limit,
+                                              reverse=reverse)
+    except ValueError as ex:
+        raise error.InvalidRequestParameter(str(ex))
+
+    logger.info('.keyset_pagination() OK.')
+    return page
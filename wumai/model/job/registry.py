@@ -0,0 +1,110 @@
+"""
+registry of job actions.
+
+an action module (by default `model.job.action` under app_root) defines one
+function per action, named by snake_case of the action:
+
+    CreateSnapshot -> def create_snapshot(params, time_sleep, **kwargs)
+
+any callable of the module works, e.g. a functools.partial, but functions
+and classes imported into it from other modules are not actions.
+
+the registry resolves action names once and caches them, and keeps optional
+per-action options set by the `action` decorator:
+
+    from wumai.model.job.registry import action
+
+    @action(timeout=3600, retry_policy='exponential')
+    def create_snapshot(params, **kwargs):
+        ...
+"""
+import sys
+import inspect
+
+from wumai.common import utils
+from wumai.model.job import retry
+
+OPTIONS = ['timeout', 'retry_policy', 'soft_timeout']
+
+
+def action(**options):
+    """
+    timeout: seconds, overrides worker's exec_timeout for this action.
+    retry_policy: name in job.retry, used by jobs created without one.
+    soft_timeout: if True, time_sleep raises error.JobSoftTimeout at the
+                  soft deadline instead of sleeping past it. other actions
+                  may check job.soft_deadline() by themselves.
+    """
+    for key in options:
+        if key not in OPTIONS:
+            raise ValueError('unknown action option: %s' % key)
+
+    def decorator(func):
+        func.job_options = options
+        return func
+    return decorator
+
+
+class Action(object):
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+        options = getattr(func, 'job_options', {})
+        self.timeout = options.get('timeout')
+        self.retry_policy = options.get('retry_policy')
+        self.soft_timeout = options.get('soft_timeout', False)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+class Registry(object):
+    def __init__(self, module_path):
+        __import__(module_path)
+        self.module = sys.modules[module_path]
+
+        # CamelCase name -> Action, resolved on first use.
+        self.actions = {}
+
+        for name, func in vars(self.module).items():
+            if name.startswith('_') or not self._is_action(func):
+                continue
+            policy = getattr(func, 'job_options', {}).get('retry_policy')
+            if policy is not None and policy not in retry.POLICIES:
+                raise ValueError('unknown retry policy of action %s: %s' %
+                                 (name, policy))
+
+    def _is_action(self, func):
+        """
+        callables of the module, but not functions or classes imported
+        into it, e.g. the action decorator.
+        """
+        if not callable(func):
+            return False
+        if inspect.isroutine(func) or inspect.isclass(func):
+            return getattr(func, '__module__', None) == self.module.__name__
+        return True
+
+    def get(self, name):
+        """
+        return the Action of name, None if it is not defined.
+        """
+        try:
+            return self.actions[name]
+        except KeyError:
+            pass
+
+        func_name = utils.snake_case(name)
+        func = getattr(self.module, func_name, None)
+        if func_name.startswith('_') or not self._is_action(func):
+            return None
+
+        self.actions[name] = Action(name, func)
+        return self.actions[name]
+
+    def unknown(self, names):
+        """
+        return names which are not defined.
+        """
+        return sorted(name for name in names if self.get(name) is None)
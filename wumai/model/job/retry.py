@@ -0,0 +1,94 @@
+"""
+retry policies of failed jobs.
+
+a policy decides if a failed try is retried, and when. jobs choose a policy
+by name at job.create(retry_policy=...), jobs without one use 'linear'.
+
+    linear:      try_period * has_tried, retries every exception.
+                 the behaviour of jobs created before retry policies.
+    exponential: 10s, 20s, 40s ... up to 1 hour, with full jitter,
+                 invalid requests (InvalidRequestParameter, ValidationError)
+                 and unsupported actions are not retried.
+
+register your own with register(name, policy).
+"""
+import random
+
+from wumai import error
+
+DEFAULT = 'linear'
+
+POLICIES = {}
+
+
+class RetryPolicy(object):
+    """
+    non_retryable: exception classes failing the job at once.
+    max_delay: seconds, upper bound of delay between two tries.
+    """
+    def __init__(self, non_retryable=(), max_delay=None):
+        self.non_retryable = tuple(non_retryable)
+        self.max_delay = max_delay
+
+    def retryable(self, ex):
+        return not isinstance(ex, self.non_retryable)
+
+    def delay(self, job, has_tried):
+        """
+        seconds to wait before next try, after has_tried tries failed.
+        """
+        seconds = self.backoff(job, has_tried)
+        if self.max_delay is not None:
+            seconds = min(seconds, self.max_delay)
+        return seconds
+
+    def backoff(self, job, has_tried):
+        raise NotImplementedError()
+
+
+class LinearRetry(RetryPolicy):
+    def backoff(self, job, has_tried):
+        return job['try_period'] * has_tried
+
+
+class ExponentialRetry(RetryPolicy):
+    """
+    base * factor ** (has_tried - 1), capped by max_delay.
+    jitter: wait a random time between 0 and the delay (full jitter),
+            so jobs failed together do not retry together.
+    """
+    def __init__(self, base=10, factor=2, jitter=True, **kwargs):
+        super(ExponentialRetry, self).__init__(**kwargs)
+        self.base = base
+        self.factor = factor
+        self.jitter = jitter
+
+    def delay(self, job, has_tried):
+        seconds = super(ExponentialRetry, self).delay(job, has_tried)
+        if self.jitter:
+            seconds = random.uniform(0, seconds)
+        return seconds
+
+    def backoff(self, job, has_tried):
+        return self.base * self.factor ** (has_tried - 1)
+
+
+def register(name, policy):
+    POLICIES[name] = policy
+
+
+def get(name=None):
+    """
+    raise KeyError if no such policy.
+    """
+    return POLICIES[name or DEFAULT]
+
+
+register('linear', LinearRetry())
+register('exponential', ExponentialRetry(
+    max_delay=3600,
+    # errors retrying can not fix. not all of ClientRequestException,
+    # e.g. ResourceIsBusy and ResourceNotFound may pass in a while.
+    non_retryable=[error.InvalidRequestParameter,
+                   error.ResourceActionUnsupported,
+                   error.ResourceNotBelongsToProject]))
@@ -0,0 +1,142 @@
+"""
+recurring jobs.
+
+a schedule creates a job of its action at every time of a cron expression,
+or every n seconds, in UTC:
+
+    from wumai.model.job.schedule import Schedule
+
+    create_worker(schedules=[
+        Schedule('sync-quota', 'SyncQuota', cron='*/5 * * * *'),
+        Schedule('collect-usage', 'CollectUsage', every=600, jitter=60),
+    ])
+
+workers create the jobs of the next `ahead` seconds in advance. the last
+created time of every schedule is kept in table job_schedule, a worker
+creates jobs only if it moves that time forward by a conditional UPDATE,
+in the same transaction. the row is locked by the first worker until its
+jobs are committed, the others see the new time and create nothing, so
+every time gets one job no matter how many workers are running.
+
+times missed while no worker was running are skipped, except those in the
+last `ahead` seconds.
+"""
+import random
+import traceback
+import calendar
+import datetime
+
+from wumai import db
+from wumai.common.cron import Cron
+from wumai.model import base
+from wumai.model.job import job
+
+from wumai import logger
+logger = logger.getChild(__file__)
+
+
+class Schedule(object):
+    def __init__(self, name, action, cron=None, every=None, params={},
+                 project_id=job.SYSTEM_JOB, jitter=0, **options):
+        """
+        name: unique name of the schedule, at most 64 chars.
+        cron: cron expression, see wumai.common.cron.
+        every: seconds, jobs run at times divisible by it since the epoch.
+        jitter: seconds, delay every job by a random time up to it,
+                so that jobs of many schedules do not start together.
+        options: priority, try_period, try_max, retry_policy or timeout
+                 of the created jobs, see job.create.
+        """
+        if (cron is None) == (every is None):
+            raise ValueError('schedule %s needs one of cron and every' %
+                             name)
+        if every is not None and every <= 0:
+            raise ValueError('invalid every of schedule %s: %s' %
+                             (name, every))
+
+        self.name = name
+        self.action = action
+        self.cron = Cron(cron) if cron is not None else None
+        self.every = every
+        self.params = params
+        self.project_id = project_id
+        self.jitter = jitter
+        self.options = options
+
+    def times(self, start, end):
+        """
+        run times later than start, not later than end.
+        """
+        times = []
+        t = self._next(start)
+        while t <= end:
+            times.append(t)
+            t = self._next(t)
+        return times
+
+    def _next(self, after):
+        if self.cron is not None:
+            return self.cron.next(after)
+
+        seconds = calendar.timegm(after.timetuple())
+        seconds = (seconds // self.every + 1) * self.every
+        return datetime.datetime.utcfromtimestamp(seconds)
+
+
+def materialize(schedules, ahead=60):
+    """
+    create jobs of schedules for the next ahead seconds.
+    return the count of created jobs.
+    """
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    until = now + datetime.timedelta(seconds=ahead)
+
+    created = 0
+    for schedule in schedules:
+        try:
+            created += _materialize(schedule, now, until, ahead)
+        except Exception:
+            logger.error('materialize schedule %s failed.' % schedule.name)
+            stack = traceback.format_exc()
+            logger.trace(stack)
+    return created
+
+
+def _materialize(schedule, now, until, ahead):
+    table = db.DB.job_schedule
+
+    state = table.get(schedule.name)
+    if state is None:
+        # a new schedule starts from now, without backfilling.
+        try:
+            table.insert(name=schedule.name, last_run_at=now, updated=now)
+        except Exception:
+            # inserted by another worker meanwhile.
+            pass
+        state = table.get(schedule.name)
+
+    last = state['last_run_at']
+    start = max(last, now - datetime.timedelta(seconds=ahead))
+    times = schedule.times(start, until)
+    if not times:
+        return 0
+
+    with base.open_transaction(db.DB):
+        if not table.update_if(schedule.name, {'last_run_at': last},
+                               last_run_at=times[-1], updated=now):
+            # another worker created them.
+            return 0
+
+        for t in times:
+            if schedule.jitter:
+                t += datetime.timedelta(
+                    seconds=random.uniform(0, schedule.jitter))
+            job.create(schedule.action,
+                       project_id=schedule.project_id,
+                       params=schedule.params,
+                       run_at=t,
+                       **schedule.options)
+
+    logger.info('schedule %s created %d jobs, until %s.' %
+                (schedule.name, len(times), times[-1]))
+    return len(times)
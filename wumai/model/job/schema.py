@@ -0,0 +1,159 @@
+"""
+recommended schema of the job table.
+
+wumai does not migrate your database, create the table with your own
+migration tool, or with `create_tables(engine)`.
+
+for an existing job table, `create_indexes(engine)` adds the missing
+recommended indexes.
+
+columns added since the first schema, add them to an existing table:
+
+    ALTER TABLE job ADD COLUMN owner VARCHAR(64),
+                    ADD COLUMN lease_expires DATETIME,
+                    ADD COLUMN priority INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN retry_policy VARCHAR(32),
+                    ADD COLUMN timeout INTEGER,
+                    ADD COLUMN dedupe_key VARCHAR(128);
+
+the index job_status_run_at of the first schema is replaced by
+job_status_priority_run_at, drop it after creating the new one.
+
+finished and error jobs are moved to table job_archive by job.archive(),
+create it with `create_tables(engine)`, or by
+
+    CREATE TABLE job_archive LIKE job;
+"""
+import sqlalchemy
+from sqlalchemy import Column, Index
+from sqlalchemy import String, Text, DateTime, Integer, LargeBinary
+
+
+def _job_columns():
+    return [
+        Column('id', String(32), primary_key=True),
+        Column('project_id', String(32), nullable=False),
+        Column('action', String(64), nullable=False),
+        Column('status', String(16), nullable=False),
+        Column('error', Text),
+        Column('result', Text),
+        Column('params', Text),
+        Column('updated', DateTime),
+        Column('created', DateTime),
+        Column('run_at', DateTime, nullable=False),
+        Column('try_period', Integer, nullable=False),
+        Column('try_max', Integer, nullable=False),
+        Column('trys', Integer, nullable=False),
+        Column('priority', Integer, nullable=False, server_default='0'),
+        Column('retry_policy', String(32)),
+        Column('timeout', Integer),
+
+        # idempotency key of an active job, cleared when the job settles.
+        Column('dedupe_key', String(128)),
+
+        # lease of a running job, renewed by heartbeats of its owner worker.
+        Column('owner', String(64)),
+        Column('lease_expires', DateTime),
+    ]
+
+
+def job_table(meta, name='job'):
+    return sqlalchemy.Table(name, meta, *(_job_columns() + [
+        # worker picks due pending jobs in priority and run_at order:
+        #   WHERE status = 'pending' AND run_at <= now
+        #   ORDER BY priority, run_at, id
+        # the index makes it a scan of pending jobs only, in that order,
+        # no matter how many finished jobs are in the table.
+        Index('%s_status_priority_run_at' % name,
+              'status', 'priority', 'run_at', 'id'),
+
+        # reaper finds running jobs whose lease expired.
+        Index('%s_status_lease_expires' % name, 'status', 'lease_expires'),
+
+        # listing jobs of a project, newest first.
+        Index('%s_project_id_created' % name, 'project_id', 'created'),
+
+        # at most one job holds a dedupe key, NULLs are not unique.
+        Index('%s_dedupe_key' % name, 'dedupe_key', unique=True),
+
+        # archiver finds finished and error jobs not updated for days.
+        Index('%s_status_updated' % name, 'status', 'updated'),
+    ]))
+
+
+def archive_table(meta, name='job_archive'):
+    """
+    finished and error jobs moved out of job by job.archive(), it has the
+    columns of job, but only the index of listing jobs of a project.
+    """
+    return sqlalchemy.Table(name, meta, *(_job_columns() + [
+        Index('%s_project_id_created' % name, 'project_id', 'created'),
+    ]))
+
+
+def blob_table(meta, name='job_blob'):
+    """
+    table of wumai.common.blob.TableStore, for large params and results
+    of jobs, set config blob_table to its name.
+    """
+    return sqlalchemy.Table(
+        name, meta,
+        Column('id', String(40), primary_key=True),
+        Column('data', LargeBinary(2 ** 32 - 1), nullable=False),
+    )
+
+
+def dependency_table(meta, name='job_dependency'):
+    """
+    jobs waiting for other jobs, job.create(depends_on=...).
+    rows are deleted once the waiting job is resolved.
+    """
+    return sqlalchemy.Table(
+        name, meta,
+        Column('job_id', String(32), primary_key=True),
+        Column('depends_on', String(32), primary_key=True),
+
+        # a settled job finds the jobs depending on it.
+        Index('%s_depends_on' % name, 'depends_on'),
+    )
+
+
+def schedule_table(meta, name='job_schedule'):
+    """
+    last created run time of every schedule, see job.schedule.
+    """
+    return sqlalchemy.Table(
+        name, meta,
+        Column('name', String(64), primary_key=True),
+        Column('last_run_at', DateTime, nullable=False),
+        Column('updated', DateTime),
+    )
+
+
+def create_tables(engine):
+    meta = sqlalchemy.MetaData()
+    job_table(meta)
+    archive_table(meta)
+    dependency_table(meta)
+    schedule_table(meta)
+    blob_table(meta)
+    meta.create_all(engine)
+
+
+def create_indexes(engine, name='job'):
+    """
+    create recommended indexes missing in an existing job table.
+    return names of created indexes.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    existing = set(index['name'] for index in inspector.get_indexes(name))
+
+    meta = sqlalchemy.MetaData()
+    table = job_table(meta, name)
+
+    created = []
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(engine)
+            created.append(index.name)
+    return created
@@ -4,7 +4,9 @@ import datetime
 from wumai import db
 from wumai.common import model
 from wumai.common import utils
+from wumai.model import base
 from wumai.model import filters
+from wumai import error
 
 from wumai import logger
 logger = logger.getChild(__file__)
@@ -62,6 +64,25 @@ def create(project_id, access_key, action, params,
     return opertn_id
 
 
+def archive(days=90, batch_size=1000, pause=0):
+    """
+    move operations created days ago into table operation_archive, which
+    has the columns of operation:
+
+        CREATE TABLE operation_archive LIKE operation;
+
+    see wumai.model.base.archive. return the count of moved operations.
+    """
+    before = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+    logger.info('.archive() start. ')
+    archived = base.archive(Operation.db(), db.DB.operation_archive,
+                            lambda t: t.created < before,
+                            batch_size=batch_size, pause=pause)
+    logger.info('.archive() OK. archived: %d' % archived)
+    return archived
+
+
 def limitation(project_ids=None, created_start=None, created_end=None,
                offset=0, limit=10, reverse=True):
     def where(t):
@@ -77,3 +98,29 @@ def limitation(project_ids=None, created_start=None, created_end=None,
                                          order_by=filters.order_by(reverse))
     logger.info('.limitation() OK. ')
     return page
+
+
+def keyset_pagination(project_ids=None, created_start=None, created_end=None,
+                      after=None, limit=10, reverse=True):
+    """
+    like limitation(), but pages by cursor instead of offset and total.
+
+    after: `next` of the previous page, None for the first page.
+    """
+    def where(t):
+        _where = True
+        _where = filters.filter_project_ids(_where, t, project_ids)
+        _where = filters.filter_created_range(_where, t, created_start, created_end)  # noqa
+        return _where
+
+    logger.info('.keyset_pagination() start. ')
+    try:
+        page = Operation.keyset_pagination_as_model(where,
+                                                    after=after,
+                                                    limit=limit,
+                                                    reverse=reverse)
+    except ValueError as ex:
+        raise error.InvalidRequestParameter(str(ex))
+
+    logger.info('.keyset_pagination() OK. ')
+    return page
@@ -0,0 +1,242 @@
+"""
+execution backends of worker.
+
+    GeventExecutor: jobs run in greenlets of a gevent pool. cheap, but a job
+                    blocking in C code (which gevent can not preempt) freezes
+                    every other job in the process.
+    ThreadExecutor: jobs run in native threads. a job blocking in C code only
+                    holds its own thread. use it without gevent monkey patch.
+                    a timed out try can not be stopped, its job is held
+                    by the worker until the try returns.
+
+both provide the same interface to worker: a bounded pool with sub-pools of
+capped actions, ids of running jobs, background tasks, events, sleep and
+running a try with a timeout.
+"""
+import sys
+import time
+import signal
+import threading
+from multiprocessing.pool import ThreadPool
+
+from gevent import Timeout
+
+from wumai.common import local
+
+from wumai import logger
+logger = logger.getChild(__file__)
+
+
+class GeventExecutor(object):
+    def __init__(self, size, action_limits=None):
+        from gevent.pool import Pool
+
+        self.size = size
+        self.pool = Pool(size)
+        self.jobs = {}
+        self.action_pools = {}
+        for action, limit in (action_limits or {}).items():
+            self.action_pools[action] = Pool(limit)
+
+    def event(self):
+        from gevent.event import Event
+        return Event()
+
+    def signal(self, signum, handler):
+        import gevent as gvt
+        gvt.signal(signum, handler)
+
+    def background(self, func):
+        import gevent as gvt
+        return gvt.spawn(func)
+
+    def sleep(self, seconds):
+        import gevent as gvt
+        gvt.sleep(seconds)
+
+    def run(self, func, seconds):
+        """
+        return func(), raise gevent Timeout if it is not done in seconds.
+        """
+        with Timeout(seconds):
+            return func()
+
+    def free_count(self):
+        return self.pool.free_count()
+
+    def action_quotas(self):
+        return dict((action, pool.free_count())
+                    for action, pool in self.action_pools.items())
+
+    def action_running(self):
+        return dict((action, len(pool))
+                    for action, pool in self.action_pools.items())
+
+    def running_ids(self):
+        """
+        ids of jobs being executed.
+        """
+        return list(self.jobs)
+
+    def spawn(self, func, job, callback, **kwargs):
+        """
+        run func(job, **kwargs), call callback() when it is done.
+        """
+        job_id = job['id']
+
+        def done(greenlet):
+            self.jobs.pop(job_id, None)
+            callback()
+
+        greenlet = self.pool.spawn(func, job, **kwargs)
+        self.jobs[job_id] = greenlet
+        greenlet.rawlink(done)
+
+        # never blocks, worker claims jobs within action quotas.
+        action_pool = self.action_pools.get(job['action'])
+        if action_pool is not None:
+            action_pool.add(greenlet)
+
+    def join(self, timeout):
+        """
+        wait for running jobs at most timeout seconds,
+        return True if all of them are done.
+        """
+        self.pool.join(timeout=timeout)
+        return len(self.pool) == 0
+
+    def kill(self, background):
+        for task in background:
+            task.kill()
+        self.pool.kill(block=True, timeout=10)
+
+
+class ThreadExecutor(object):
+    def __init__(self, size, action_limits=None):
+        self.size = size
+        self.pool = ThreadPool(size)
+        self.action_limits = dict(action_limits or {})
+
+        self.lock = threading.Condition()
+        self.running = 0
+        self.jobs = set()
+        self.action_counts = dict((action, 0) for action in self.action_limits)
+
+    def event(self):
+        return threading.Event()
+
+    def signal(self, signum, handler):
+        signal.signal(signum, lambda signum, frame: handler())
+
+    def background(self, func):
+        thread = threading.Thread(target=func)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def run(self, func, seconds):
+        """
+        run func() in a thread of its own and wait for it at most seconds,
+        return what it returns, raise what it raises, or raise gevent
+        Timeout if it is not done in time.
+
+        a thread can not be stopped, so a timed out try is waited for till
+        it returns, then Timeout is raised and what it returns is dropped.
+        meanwhile the job keeps its slot, and its lease is renewed, so it
+        is not tried again while the try is still running.
+        """
+        context_id = local.get_context_id()
+        outcome = {}
+
+        def target():
+            local.set_context_id(context_id)
+            try:
+                outcome['result'] = func()
+            except BaseException:
+                outcome['exc_info'] = sys.exc_info()
+            finally:
+                local.clear_context()
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        thread.join(seconds)
+
+        if thread.is_alive():
+            logger.error('try timed out in %s seconds, waiting for its '
+                         'thread to return.' % seconds)
+            thread.join()
+            raise Timeout(seconds)
+
+        if 'exc_info' in outcome:
+            exc_type, exc_value, exc_tb = outcome['exc_info']
+            raise exc_type, exc_value, exc_tb
+        return outcome['result']
+
+    def free_count(self):
+        with self.lock:
+            return self.size - self.running
+
+    def action_quotas(self):
+        with self.lock:
+            return dict((action, limit - self.action_counts[action])
+                        for action, limit in self.action_limits.items())
+
+    def action_running(self):
+        with self.lock:
+            return dict(self.action_counts)
+
+    def running_ids(self):
+        """
+        ids of jobs being executed.
+        """
+        with self.lock:
+            return list(self.jobs)
+
+    def spawn(self, func, job, callback, **kwargs):
+        """
+        run func(job, **kwargs), call callback() when it is done.
+        """
+        action = job['action']
+        job_id = job['id']
+        with self.lock:
+            self.running += 1
+            self.jobs.add(job_id)
+            if action in self.action_counts:
+                self.action_counts[action] += 1
+
+        def run():
+            try:
+                func(job, **kwargs)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.jobs.discard(job_id)
+                    if action in self.action_counts:
+                        self.action_counts[action] -= 1
+                    self.lock.notify_all()
+                callback()
+
+        self.pool.apply_async(run)
+
+    def join(self, timeout):
+        """
+        wait for running jobs at most timeout seconds,
+        return True if all of them are done.
+        """
+        deadline = time.time() + timeout
+        with self.lock:
+            while self.running > 0 and time.time() < deadline:
+                self.lock.wait(deadline - time.time())
+            return self.running == 0
+
+    def kill(self, background):
+        """
+        threads can not be killed, running jobs are left to finish,
+        their results are dropped once worker releases their leases.
+        background threads are daemons, they exit with the process.
+        """
+        self.pool.close()
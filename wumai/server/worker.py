@@ -1,12 +1,18 @@
-import sys
+import os
+import time
+import errno
+import random
+import socket
 import traceback
-import datetime
 
 import signal
 import abc
 
 from wumai import bootstrap
 from wumai import logger
+from wumai.common import utils
+from wumai.model.job.registry import Registry
+from wumai.server.executor import GeventExecutor, ThreadExecutor
 
 
 class JobNotifier(object):
@@ -27,107 +33,395 @@ class Worker(object):
                  pick_size=10,
                  exec_size=10,
                  exec_timeout=600,
-                 gevent=True):
+                 exec_grace=30,
+                 gevent=True,
+                 poll_interval=2,
+                 poll_max=30,
+                 metrics_interval=60,
+                 lease=60,
+                 action_limits=None,
+                 drain_timeout=30,
+                 action_module='model.job.action',
+                 archive_days=None,
+                 archive_operation_days=None,
+                 archive_interval=3600,
+                 schedules=None,
+                 schedule_interval=30):
         """
-        exec_size: gevent pool size, max running greenlets, default 10
-        pick_size: how many jobs fetched from db at a time, default 10
-        exec_timeout: how many seconds a execute try timeout, default 600s
+        exec_size: pool size, max running jobs, default 10
+        pick_size: how many jobs fetched from db at a time, default 10,
+                   never more than free slots in the pool.
+        exec_timeout: how many seconds a execute try timeout, default 600s,
+                      actions and jobs may have their own timeout.
+        exec_grace: seconds between the soft deadline and the timeout of
+                    a try, default 30s, at most half of the timeout.
+                    actions may check job.soft_deadline() to checkpoint
+                    and stop before the timeout, or opt in with the
+                    soft_timeout action option to get error.JobSoftTimeout
+                    from time_sleep.
+        gevent: run jobs in greenlets if True (default), else in native
+                threads, for actions blocking in C libraries which gevent
+                can not preempt. set config gevent=False as well, so the
+                process is not monkey patched.
+        poll_interval: seconds between two db polls, default 2s
+        poll_max: when idle, poll interval doubles up to poll_max, default 30s
+        metrics_interval: seconds between two metrics logs, default 60s
+        lease: seconds a running job is leased to this worker, default 60s.
+               leases are renewed every lease/3 seconds while the worker is
+               alive, jobs whose lease expired are reset to pending by any
+               worker. with gevent, must be longer than the longest block
+               of code that does not yield to gevent.
+        action_limits: {action: n}, at most n jobs of action running at a
+                       time in this worker, e.g. {'CreateSnapshot': 2}.
+                       jobs of other actions are picked when an action
+                       reaches its limit, so slow bulk actions can not
+                       take all slots of the pool.
+        drain_timeout: on SIGTERM, SIGINT or SIGQUIT the worker stops
+                       picking jobs and waits for running jobs at most
+                       drain_timeout seconds, default 30s. jobs still
+                       running are stopped and put back to pending.
+        action_module: module path of action functions, under app_root,
+                       default 'model.job.action'. see job.registry.
+        archive_days: move finished and error jobs not updated for
+                      archive_days into table job_archive, default None,
+                      never. keeps the job table small for picking.
+        archive_operation_days: move operations created archive_operation_days
+                                ago into table operation_archive, default
+                                None, never.
+        archive_interval: seconds between two archivings, default 3600s.
+        schedules: job.schedule.Schedule list, recurring jobs created by
+                   this worker, default None. run the same schedules in
+                   all workers, every run time still gets one job.
+        schedule_interval: seconds between two schedulings, default 30s.
+                           jobs of the next 2 * schedule_interval seconds
+                           are created in advance.
+
+        new jobs wake up the worker through wakeup channel immediately,
+        polling is only a fallback for delayed jobs and lost wakeups.
         """
-        event = None
-        pool = None
-
         if gevent:
-            import gevent as gvt
-            from gevent.event import Event
-            from gevent.pool import Pool
-
-            event = Event()
-            gvt.signal(signal.SIGQUIT, event.set)
-            gvt.signal(signal.SIGTERM, event.set)
-            gvt.signal(signal.SIGINT, event.set)
-            pool = Pool(exec_size)
-
+            executor = GeventExecutor(exec_size, action_limits)
         else:
-            raise ('Gevent is the only supported thread model '
-                   'in worker by now! please set gevent=True')
+            executor = ThreadExecutor(exec_size, action_limits)
 
-        self.event = event
-        self.pool = pool
+        self.executor = executor
+        self.event = executor.event()
+        self.wakeup = executor.event()
+        executor.signal(signal.SIGQUIT, self.stop)
+        executor.signal(signal.SIGTERM, self.stop)
+        executor.signal(signal.SIGINT, self.stop)
 
         self.exec_timeout = exec_timeout
+        self.exec_grace = exec_grace
+        self.exec_size = exec_size
         self.pick_size = pick_size
         self.gevent = gevent
+        self.poll_interval = poll_interval
+        self.poll_max = poll_max
+        self.metrics_interval = metrics_interval
+        self.lease = lease
+        self.drain_timeout = drain_timeout
+        self.archive_days = archive_days
+        self.archive_operation_days = archive_operation_days
+        self.archive_interval = archive_interval
+        self.schedules = schedules or []
+        self.schedule_interval = schedule_interval
+        self.worker_id = '%s:%d:%s' % (socket.gethostname(), os.getpid(),
+                                       utils.generate_key(4))
+
+        # counters since worker started.
+        self.claimed = 0
+        self.saturated = 0
 
         self._init_logger()
-        self._init_action_module()
+        self._init_action_module(action_module)
 
         self.notifiers = []
 
-    def _init_action_module(self):
-        # hardcoded module path.
-        action_module = 'model.job.action'
-        __import__(action_module)
-        self.action_module = sys.modules[action_module]
+    def _init_action_module(self, action_module):
+        self.actions = Registry(action_module)
+        self.action_module = self.actions.module
+
+    def _check_actions(self):
+        """
+        log pending jobs and schedules whose action is not defined,
+        their jobs will fail when they are picked.
+        """
+        from wumai.model.job import job as job_model
+
+        unknown = self.actions.unknown(set(s.action for s in self.schedules))
+        if unknown:
+            self.logger.error('actions of schedules are not defined in '
+                              '%s: %s' % (self.action_module.__name__,
+                                          ', '.join(unknown)))
+
+        try:
+            unknown = self.actions.unknown(job_model.pending_actions())
+        except Exception:
+            stack = traceback.format_exc()
+            self.logger.trace(stack)
+            return
+
+        if unknown:
+            self.logger.error('actions of pending jobs are not defined in '
+                              '%s: %s' % (self.action_module.__name__,
+                                          ', '.join(unknown)))
 
     def _init_logger(self):
         self.logger = logger.getChild(__file__)
 
+    def stop(self):
+        self.event.set()
+        self.wakeup.set()
+
     def start(self):
         from wumai.model.job import job as job_model
-        from wumai.model.job import run_job
+        from wumai.model.job import execute_job
 
         self._clean()
+        self._check_actions()
+
+        background = [self.executor.background(self._listen_wakeup),
+                      self.executor.background(self._keep_leases)]
+        if self.archive_days or self.archive_operation_days:
+            background.append(self.executor.background(self._archive))
+        if self.schedules:
+            background.append(self.executor.background(self._schedule))
 
+        interval = self.poll_interval
+        metrics_at = time.time() + self.metrics_interval
         while True:
+            fetched = 0
+            free = self.executor.free_count()
+            size = min(self.pick_size, free)
             try:
-                jobs = job_model.limitation(status=job_model.JOB_STATUS_PENDING,  # noqa
-                                            limit=self.pick_size,
-                                            run_at=datetime.datetime.utcnow())
-                if jobs['total'] == 0:
-                    self.logger.info('fetched 0 jobs')
+                if size == 0:
+                    # pool is full, leave jobs to other workers.
+                    # a finished job wakes us up.
+                    self.saturated += 1
+                    self.logger.info('pool is full, skip fetching jobs')
                 else:
-                    self.logger.info('fetched %s jobs. execute them sequencely' %  # noqa
-                                len(jobs['items']))
-
-                    for job in jobs['items']:
-                        self.pool.spawn(run_job, job['id'], worker=self)
+                    quotas = self.executor.action_quotas()
+                    jobs = job_model.claim(size, self.worker_id, self.lease,
+                                           quotas=quotas)
+                    fetched = len(jobs)
+                    self.claimed += fetched
+
+                    if fetched == 0:
+                        self.logger.info('fetched 0 jobs')
+                    else:
+                        self.logger.info(('fetched %s jobs. '
+                                          'execute them sequencely') % fetched)
+
+                        for job in jobs:
+                            self.executor.spawn(execute_job, job,
+                                                self._on_job_done,
+                                                worker=self)
 
             except:
                 stack = traceback.format_exc()
                 self.logger.trace(stack)
 
-            if self.event.wait(timeout=2):
-                self.pool.kill(block=True)
-                self.pool.join(timeout=10)
+            if time.time() >= metrics_at:
+                metrics_at = time.time() + self.metrics_interval
+                self._log_metrics()
+
+            if size == 0:
+                timeout = self.poll_interval
+            elif fetched >= size:
+                # there may be more jobs waiting, fetch again right now.
+                timeout = 0
+                interval = self.poll_interval
+            elif fetched > 0:
+                timeout = interval = self.poll_interval
+            else:
+                # idle, back off the polling.
+                timeout = interval
+                interval = min(interval * 2, self.poll_max)
+
+            # stop() sets wakeup too.
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+            if self.event.is_set():
+                self._drain(background)
                 break
 
-    def _clean(self):
+    def _drain(self, background):
         """
-        if there is no running job, but in db, there are jobs status running,
-        then we should clean jobs.
+        let running jobs finish until drain_timeout, leases are still
+        renewed meanwhile. then stop the rest and put them back to pending
+        at once, instead of waiting for their leases to expire.
+        """
+        from wumai.model.job import job as job_model
+
+        running = self.exec_size - self.executor.free_count()
+        self.logger.info('draining, wait %ds for %d running jobs.' %
+                         (self.drain_timeout, running))
+
+        drained = self.executor.join(self.drain_timeout)
+        self.executor.kill(background)
+
+        if drained:
+            self.logger.info('drained, all running jobs are done.')
+            return
 
-        update database, find running jobs and set their status to pending.
+        try:
+            released = job_model.release_leases(self.worker_id)
+            self.logger.info(('drain timeout, %d running jobs are '
+                              'put back to pending.') % released)
+        except Exception:
+            stack = traceback.format_exc()
+            self.logger.trace(stack)
+
+    def _on_job_done(self):
+        # a slot is free, wake up the loop if it is waiting for one.
+        if self.executor.free_count() > 0:
+            self.wakeup.set()
+
+    def metrics(self, queue_depth=False):
+        """
+        queue_depth: count due pending jobs in db, costs a COUNT query.
+        """
+        free = self.executor.free_count()
+        metrics = {
+            'exec_size': self.exec_size,
+            'running': self.exec_size - free,
+            'free_slots': free,
+            'claimed': self.claimed,
+            'saturated': self.saturated,
+        }
 
-        reason: we may stop the worker when a job is being executed.
+        for action, running in self.executor.action_running().items():
+            metrics['running_%s' % action] = running
+
+        if queue_depth:
+            from wumai.model.job import job as job_model
+            metrics['queue_depth'] = job_model.count_due()
+
+        return metrics
+
+    def _log_metrics(self):
+        try:
+            metrics = self.metrics(queue_depth=True)
+        except Exception:
+            stack = traceback.format_exc()
+            self.logger.trace(stack)
+        else:
+            self.logger.info('metrics: %s' % ', '.join(
+                '%s=%s' % (k, v) for k, v in sorted(metrics.items())))
+
+    def _listen_wakeup(self):
+        """
+        set self.wakeup when a job is created.
+        reconnect if the channel is broken.
+        """
+        from gevent import monkey
+        from wumai import wakeup
+
+        if wakeup.CHANNEL is None:
+            self.logger.info('no wakeup channel, fallback to polling.')
+            return
+
+        if self.gevent and not monkey.is_module_patched('socket'):
+            self.logger.info(('socket is not patched by gevent, '
+                              'wakeup channel disabled, '
+                              'fallback to polling.'))
+            return
+
+        def on_message(message):
+            self.wakeup.set()
+
+        while True:
+            try:
+                wakeup.listen(on_message)
+            except Exception:
+                stack = traceback.format_exc()
+                self.logger.trace(stack)
+
+            self.executor.sleep(self.poll_interval)
+
+    def _keep_leases(self):
+        """
+        heartbeat, renew leases of our running jobs every lease/3 seconds,
+        reap expired leases of dead workers, and resolve waiting jobs missed
+        by them, every lease seconds.
+        """
+        from wumai.model.job import job as job_model
+
+        reap_at = time.time() + self.lease
+        while True:
+            self.executor.sleep(self.lease / 3.0)
+            try:
+                job_ids = self.executor.running_ids()
+                if job_ids:
+                    job_model.renew_leases(self.worker_id, job_ids,
+                                           self.lease)
+
+                if time.time() >= reap_at:
+                    reap_at = time.time() + self.lease
+                    job_model.reap_expired()
+                    job_model.resolve_waiting(worker=self)
+            except Exception:
+                stack = traceback.format_exc()
+                self.logger.trace(stack)
+
+    def _archive(self):
+        """
+        archive old jobs and operations every archive_interval seconds.
+        rows are moved in small batches skipping locked ones, so workers
+        archiving at the same time do not block each other or the pickers.
+        """
+        from wumai.model.job import job as job_model
+        from wumai.model.journal import operation
+
+        # workers started together do not archive together.
+        self.executor.sleep(random.uniform(0, self.archive_interval))
+        while True:
+            try:
+                if self.archive_days:
+                    job_model.archive(self.archive_days)
+                if self.archive_operation_days:
+                    operation.archive(self.archive_operation_days)
+            except Exception:
+                stack = traceback.format_exc()
+                self.logger.trace(stack)
+
+            self.executor.sleep(self.archive_interval)
+
+    def _schedule(self):
+        """
+        create jobs of schedules every schedule_interval seconds.
+        """
+        from wumai.model.job import schedule
+
+        while True:
+            try:
+                schedule.materialize(self.schedules,
+                                     ahead=2 * self.schedule_interval)
+            except Exception:
+                stack = traceback.format_exc()
+                self.logger.trace(stack)
+
+            self.executor.sleep(self.schedule_interval)
+
+    def _clean(self):
+        """
+        reset running jobs whose lease expired to pending.
+
+        reason: a worker may be killed when a job is being executed.
         then the database status will end up in 'running' state,
-        but the job has been killed.
+        but the job has been killed. the lease of such a job is not renewed
+        any more, once it expires, the job is executed again.
         """
         from wumai.model.job import job as job_model
-        from wumai.model.job import clean_job
 
         try:
-            jobs = job_model.limitation(status=job_model.JOB_STATUS_RUNNING,
-                                        limit=0,
-                                        run_at=datetime.datetime.utcnow())
-            self.logger.info(('there are %d running jobs to clean') % jobs['total'])  # noqa
-            for job in jobs['items']:
-                self.pool.spawn(clean_job, job['id'])
+            job_model.reap_expired()
         except:
             stack = traceback.format_exc()
             self.logger.trace(stack)
 
-        self.pool.join()
-
     def add_notifiers(self, notis):
         for noti in notis:
             self.add_notifier(noti)
@@ -146,10 +440,125 @@ class Worker(object):
                 noti.call(job, *args, **kwargs)
 
 
-def create_worker(**kwargs):
+class Supervisor(object):
+    """
+    fork processes workers, restart crashed ones.
+
+    every child process bootstraps itself (db engines, redis connections,
+    gevent monkey patch) after fork, nothing but config is shared. children
+    claim jobs by SKIP LOCKED / compare and set, with their own worker_id
+    for leases, so they never run the same job.
+
+    SIGTERM, SIGINT and SIGQUIT are sent to all children, the supervisor
+    exits when all of them exit.
+    """
+    def __init__(self, processes, restart_delay=1, **kwargs):
+        """
+        processes: how many worker processes
+        restart_delay: seconds to wait before restarting a crashed worker
+        kwargs: passed to every Worker
+        """
+        self.processes = processes
+        self.restart_delay = restart_delay
+        self.worker_kwargs = kwargs
+
+        self.children = {}
+        self.stopping = False
+
+        # given to every Worker, so they are in every child process.
+        self.notifiers = []
+
+        self.logger = logger.getChild(__file__)
+
+    def add_notifiers(self, notis):
+        for noti in notis:
+            self.add_notifier(noti)
+        return self
+
+    def add_notifier(self, noti):
+        self.notifiers.append(noti)
+        return self
+
+    def start(self):
+        signal.signal(signal.SIGQUIT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for i in range(self.processes):
+            self._spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError as ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno == errno.ECHILD:
+                    break
+                raise
+
+            if pid not in self.children:
+                continue
+            del self.children[pid]
+
+            if self.stopping:
+                self.logger.info('worker %d exited, status %d.' %
+                                 (pid, status))
+                continue
+
+            self.logger.error('worker %d crashed, status %d, restart it.' %
+                              (pid, status))
+            time.sleep(self.restart_delay)
+            if not self.stopping:
+                self._spawn()
+
+        self.logger.info('all workers exited.')
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for signum in [signal.SIGQUIT, signal.SIGTERM, signal.SIGINT]:
+                    signal.signal(signum, signal.SIG_DFL)
+                random.seed()
+
+                bootstrap.init()
+                worker = Worker(**self.worker_kwargs)
+                worker.add_notifiers(self.notifiers)
+                worker.start()
+            except Exception:
+                stack = traceback.format_exc()
+                self.logger.trace(stack)
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.logger.info('worker %d started.' % pid)
+        self.children[pid] = time.time()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.children.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+def create_worker(processes=1, **kwargs):
+    """
+    processes: if more than 1, return a Supervisor running
+               processes workers, to use all cores.
+    """
     from wumai.server import ensure_config_setup
     ensure_config_setup()
 
+    if processes > 1:
+        # children bootstrap after fork.
+        logger.init(dirname='worker')
+        return Supervisor(processes, **kwargs)
+
     bootstrap.init()
     logger.init(dirname='worker')
 
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from wumai import cache
+from wumai.common import utils
+from wumai.common import wakeup
+
+CHANNEL = None
+
+JOB_CHANNEL_NAME = 'wumai-job'
+
+
+def setup():
+    """
+    use redis pub/sub if redis is available, else fallback to local
+    unix sockets, which only wakes up workers on the same host.
+    """
+    global CHANNEL
+
+    connection = cache.get_connection()
+    if connection is not None:
+        CHANNEL = wakeup.RedisChannel(connection, JOB_CHANNEL_NAME)
+    else:
+        directory = os.path.join(tempfile.gettempdir(), 'wumai-wakeup')
+        CHANNEL = wakeup.SocketChannel(directory, JOB_CHANNEL_NAME)
+
+
+def publish(message=''):
+    """
+    wake up listeners. never fails, workers will poll db anyway.
+    """
+    if CHANNEL is None:
+        return
+
+    with utils.silent():
+        CHANNEL.publish(message)
+
+
+def listen(callback):
+    CHANNEL.listen(callback)